@@ -0,0 +1,142 @@
+"""
+JSON Codec Benchmark
+
+Measures records/sec for each JSON codec the converter can use (the json module and whichever
+of orjson, simdjson and ujson are installed):
+
+- encode: one record to an NDJSON line, as written for every converted record
+- decode: parsing a whole report at once (STREAMING_PARSER = False, or a non-array file); the
+  default streaming parser reads top-level arrays with the json module whatever the codec
+- convert: convert_json_to_ndjson end to end with that codec (streaming parser, validation)
+
+Encode and decode are timed with the garbage collector off; convert runs as it does in service.
+
+Run it with Zeek reports to measure on real data, e.g.
+`python3 json_codec_benchmark.py FM1/conn.json FM1/dns.json`; each must be a top-level JSON
+array. Without arguments it generates RECORDS synthetic conn.log records.
+
+The converter is loaded straight from json_to_ndjson_V0.9.py so the benchmark always measures
+the code that is deployed.
+"""
+
+import os
+import io
+import gc
+import sys
+import json
+import time
+import random
+import tempfile
+import contextlib
+import importlib.util
+
+# Script under test
+CONVERTER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "json_to_ndjson_V0.9.py")
+
+# Benchmark settings
+RECORDS = 200000
+SEED = 1
+
+# Function to load the converter as a module
+def load_script(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# Function to generate Zeek conn.log style records
+def synthetic_records(count):
+    rng = random.Random(SEED)
+    records = []
+    for i in range(count):
+        records.append({
+            "ts": 1700000000 + i * 0.013,
+            "uid": "C" + "".join(rng.choice("ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz0123456789") for _ in range(17)),
+            "id.orig_h": f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}",
+            "id.orig_p": rng.randrange(1024, 65536),
+            "id.resp_h": f"192.168.{rng.randrange(256)}.{rng.randrange(256)}",
+            "id.resp_p": rng.choice([53, 80, 123, 443, 445, 3389]),
+            "proto": rng.choice(["tcp", "udp", "icmp"]),
+            "service": rng.choice(["dns", "http", "ssl", None]),
+            "duration": rng.random() * 30,
+            "orig_bytes": rng.randrange(0, 100000),
+            "resp_bytes": rng.randrange(0, 1000000),
+            "conn_state": rng.choice(["SF", "S0", "REJ", "RSTO", "OTH"]),
+            "local_orig": True,
+            "local_resp": False,
+            "missed_bytes": 0,
+            "history": rng.choice(["ShADadFf", "Dd", "S", "ShAdDaFf"]),
+            "orig_pkts": rng.randrange(1, 500),
+            "orig_ip_bytes": rng.randrange(40, 200000),
+            "resp_pkts": rng.randrange(0, 800),
+            "resp_ip_bytes": rng.randrange(0, 1200000),
+            "tunnel_parents": [],
+        })
+    return records
+
+# Function to time a call with the garbage collector off, as timeit does, so the codecs are
+# compared on their own cost rather than on when a collection happens to run
+def timed(function, *args):
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        function(*args)
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+# Function to encode every record
+def encode_all(encode_line, records):
+    for record in records:
+        encode_line(record)
+
+# Function to measure records/sec of encoding records as NDJSON lines
+def bench_encode(encode_line, records):
+    return len(records) / timed(encode_all, encode_line, records)
+
+# Function to measure records/sec of parsing a whole report
+def bench_decode(loads, text, count):
+    return count / timed(loads, text)
+
+# Function to measure records/sec of a full conversion with the given codec
+def bench_convert(converter, codec_name, report_path, work_dir, count):
+    converter.codec = converter.JsonCodec([codec_name])
+    ndjson_path = os.path.join(work_dir, "out.ndjson")
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        converter.convert_json_to_ndjson(report_path, ndjson_path)
+    elapsed = time.perf_counter() - start
+    os.remove(ndjson_path)
+    return count / elapsed
+
+def main():
+    converter = load_script("json_to_ndjson", CONVERTER_SCRIPT)
+    work_dir = tempfile.mkdtemp(prefix="json_codec_bench_")
+
+    report_paths = sys.argv[1:]
+    if not report_paths:
+        report_path = os.path.join(work_dir, "conn.json")
+        with open(report_path, "w") as report:
+            json.dump(synthetic_records(RECORDS), report)
+        report_paths = [report_path]
+
+    codecs = converter.available_codecs()
+    for report_path in report_paths:
+        with open(report_path) as report:
+            text = report.read()
+        records = json.loads(text)
+        print(f"\n{os.path.basename(report_path)}: {len(records)} records, {len(text) / 1e6:.1f} MB")
+        print(f"{'codec':<10}{'encode rec/s':>16}{'decode rec/s':>16}{'convert rec/s':>16}")
+        for name, (encode_line, loads) in codecs.items():
+            encode_rate = f"{bench_encode(encode_line, records):,.0f}" if encode_line else "-"
+            decode_rate = f"{bench_decode(loads, text, len(records)):,.0f}" if loads else "-"
+            convert_rate = bench_convert(converter, name, report_path, work_dir, len(records))
+            print(f"{name:<10}{encode_rate:>16}{decode_rate:>16}{convert_rate:>16,.0f}")
+
+    for filename in os.listdir(work_dir):
+        os.remove(os.path.join(work_dir, filename))
+    os.rmdir(work_dir)
+
+if __name__ == "__main__":
+    sys.exit(main())
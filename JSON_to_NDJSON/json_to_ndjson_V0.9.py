@@ -1,11 +1,27 @@
 import os
+import re
 import json
+import math
 import time
 import sys
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from concurrent.futures import ThreadPoolExecutor
-from threading import Thread
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Thread, BoundedSemaphore, Lock
+
+try:
+    import orjson
+except ImportError:  # optional accelerated codecs, the json module is used without them
+    orjson = None
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
 
 # Directories to monitor
 directories = ['./FM1', './FM2', './FM3']
@@ -13,6 +29,23 @@ directories = ['./FM1', './FM2', './FM3']
 # Flag to enable/disable schema validation
 ENABLE_SCHEMA_VALIDATION = True  # Set to False to disable schema validation
 
+# Flag to parse top-level JSON arrays element by element instead of loading the whole file
+STREAMING_PARSER = True  # Set to False to parse the entire file at once
+STREAM_READ_SIZE = 1024 * 1024  # Characters read from the file at a time
+STREAM_MAX_ELEMENT_SIZE = 64 * 1024 * 1024  # Largest single array element the parser will buffer
+
+# Accelerated JSON libraries to use when installed, in order of preference; the json module is
+# the fallback. simdjson only parses and orjson only encodes (it parses integers wider than
+# 64 bits as floats, losing digits), so each direction uses the first library that supports it.
+JSON_LIBRARIES = ["orjson", "simdjson", "ujson"]
+# NDJSON output is written through a buffer of this size
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Conversion processes shared by all monitored directories (None = one per CPU core)
+CONVERSION_WORKERS = None
+# Files queued or converting at once; new files wait for a free slot beyond this (None = 2 per worker)
+MAX_PENDING_CONVERSIONS = None
+
 # ANSI color codes
 BLUE = '\033[94m'
 GREEN = '\033[92m'
@@ -21,117 +54,214 @@ RED = '\033[91m'
 RESET = '\033[0m'
 BOLD = '\033[1m'
 
-# Function to get schema for a file - this was the missing function
-def get_schema_for_file(json_file_path):
-    schema = {
-        "required_keys": [],
-        "optional_keys": [],
-        "key_types": {}
-    }
-    
+# Functions to encode one record as an NDJSON line (bytes, newline included)
+def json_encode_line(obj):
+    return (json.dumps(obj) + '\n').encode()
+
+def orjson_encode_line(obj):
     try:
-        with open(json_file_path, 'r') as json_file:
-            try:
-                data = json.load(json_file)
-                
-                if isinstance(data, list) and len(data) > 0:
-                    first_element = data[0]
-                    
-                    # If first element is an array, it's likely a header with field names
-                    if isinstance(first_element, list) and all(isinstance(x, str) for x in first_element):
-                        schema["required_keys"] = first_element
-                    # If first element is a dictionary, use it as a template
-                    elif isinstance(first_element, dict):
-                        schema["required_keys"] = list(first_element.keys())
-                        for key, value in first_element.items():
-                            if value is not None:
-                                schema["key_types"][key] = type(value)
-                
-                elif isinstance(data, dict):
-                    schema["required_keys"] = list(data.keys())
-                    for key, value in data.items():
-                        if value is not None:
-                            schema["key_types"][key] = type(value)
-                
-                print(f"{BLUE}[INFO]{RESET} Extracted schema with {len(schema['required_keys'])} fields")
-                return schema
-            
-            except json.JSONDecodeError:
-                # If we can't parse the file, just return an empty schema
-                print(f"{YELLOW}[WARNING]{RESET} Could not parse JSON to extract schema")
-                return schema
-    except Exception as e:
-        print(f"{YELLOW}[WARNING]{RESET} Error reading file for schema extraction: {str(e)}")
-        return schema
+        line = orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    except orjson.JSONEncodeError:
+        # orjson rejects integers wider than 64 bits, which the json module can still write
+        return json_encode_line(obj)
+    # orjson writes NaN and Infinity as null; the json module keeps them, so records that had
+    # them go through it (only checked when the line has a null, which Zeek logs rarely do)
+    if b'null' in line and has_non_finite(obj):
+        return json_encode_line(obj)
+    return line
+
+# Function to check whether a record holds a NaN or infinite float anywhere
+def has_non_finite(value):
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(has_non_finite(v) for v in value.values())
+    if isinstance(value, list):
+        return any(has_non_finite(v) for v in value)
+    return False
+
+def ujson_encode_line(obj):
+    return (ujson.dumps(obj, escape_forward_slashes=False) + '\n').encode()
+
+# Functions to parse a whole document, raising json.JSONDecodeError like the json module does
+def simdjson_loads(text):
+    try:
+        return simdjson.loads(text)
+    except (ValueError, RuntimeError):
+        # Either corrupt, or JSON the json module accepts and simdjson doesn't, such as NaN,
+        # Infinity or integers wider than 64 bits; the json module decides which
+        return json.loads(text)
+
+def ujson_loads(text):
+    try:
+        return ujson.loads(text)
+    except ValueError as e:
+        raise json.JSONDecodeError(str(e), '', 0)
+
+# Function to list the installed codecs: name -> (encode_line, loads), None where a library
+# can't do one of the two
+def available_codecs():
+    codecs = {"json": (json_encode_line, json.loads)}
+    if orjson is not None:
+        codecs["orjson"] = (orjson_encode_line, None)
+    if simdjson is not None:
+        codecs["simdjson"] = (None, simdjson_loads)
+    if ujson is not None:
+        codecs["ujson"] = (ujson_encode_line, ujson_loads)
+    return codecs
+
+# JSON codec used for records: the first installed library in the preference list for each
+# direction, falling back to the json module
+class JsonCodec:
+    def __init__(self, libraries=JSON_LIBRARIES):
+        codecs = available_codecs()
+        candidates = [name for name in [*libraries, "json"] if name in codecs]
+        self.encoder = next(name for name in candidates if codecs[name][0])
+        self.decoder = next(name for name in candidates if codecs[name][1])
+        self.encode_line = codecs[self.encoder][0]
+        self.loads = codecs[self.decoder][1]
+
+codec = JsonCodec()
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+NUMBER_TAIL = re.compile(r'[0-9eE.+-]*\Z')
+# Boundary between two array elements ("}, {" or "], ["), where recovery resumes after an error
+ELEMENT_BOUNDARY = re.compile(r'[}\]][ \t\n\r]*,[ \t\n\r]*(?=[{\[])')
+ELEMENT_BOUNDARY_OVERLAP = 1024  # Characters kept across blocks while searching for a boundary
+
+# Function to return the first non-whitespace character of a file, leaving the file at the start
+def peek_first_char(json_file):
+    while True:
+        char = json_file.read(1)
+        if not char or not char.isspace():
+            json_file.seek(0)
+            return char
+
+# Generator that yields the elements of a top-level JSON array one at a time, reading the file
+# in blocks so memory use is bounded by the largest element instead of the file size.
+# With recover=True, an element that fails to decode is skipped by resynchronizing on the next
+# element boundary instead of raising, so one bad record doesn't cost the rest of the file.
+def iter_json_array(json_file, recover=False):
+    decoder = json.JSONDecoder()
+    buffer = json_file.read(STREAM_READ_SIZE)
+    pos = 0
+    count = 0
+    skipped = 0
+
+    # Append the next block to the unconsumed part of the buffer, growing the read while a
+    # single element is larger than the buffer; returns False at the end of the file
+    def refill():
+        nonlocal buffer, pos
+        chunk = json_file.read(max(STREAM_READ_SIZE, len(buffer) - pos))
+        if not chunk:
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip_whitespace():
+        nonlocal pos
+        pos = WHITESPACE.match(buffer, pos).end()
+        while pos == len(buffer) and refill():
+            pos = WHITESPACE.match(buffer, pos).end()
+
+    # Step over the closing ']'; like json.load, anything but whitespace after it is an error
+    def finish_array():
+        nonlocal pos
+        pos += 1
+        skip_whitespace()
+        if pos < len(buffer):
+            raise json.JSONDecodeError("Extra data", buffer, pos)
+
+    skip_whitespace()
+    if buffer[pos:pos + 1] != '[':
+        if recover:
+            return
+        raise json.JSONDecodeError("Expecting '['", buffer, pos)
+    pos += 1
+
+    while True:
+        skip_whitespace()
+        if pos == len(buffer):
+            if recover:
+                break
+            raise json.JSONDecodeError("Expecting value", buffer, pos)
+        if buffer[pos] == ']':
+            if recover:
+                # After resynchronizing this may close a nested list rather than the array
+                # itself, so keep going until the end of the file
+                pos += 1
+                continue
+            if count == 0:
+                finish_array()
+                return
+            raise json.JSONDecodeError("Expecting value", buffer, pos)
+
+        try:
+            element, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            # An element cut off by the end of the buffer is retried with the next block
+            truncated = e.pos >= len(buffer) - 8 or e.msg.startswith("Unterminated string")
+            if (truncated or not recover) and len(buffer) - pos <= STREAM_MAX_ELEMENT_SIZE and refill():
+                continue
+            if not recover:
+                raise
+            skipped += 1
+            while True:
+                boundary = ELEMENT_BOUNDARY.search(buffer, pos)
+                if boundary:
+                    pos = boundary.end()
+                    break
+                # Keep the tail in case the boundary straddles the next block
+                pos = max(pos, len(buffer) - ELEMENT_BOUNDARY_OVERLAP)
+                if not refill():
+                    pos = len(buffer)
+                    break
+            continue
+        # A number that runs to the end of the buffer may continue in the next block
+        if (end == len(buffer) or buffer[end] not in ',]') and NUMBER_TAIL.match(buffer, end) and refill():
+            continue
+
+        pos = end
+        count += 1
+        yield element
+
+        if pos == len(buffer) or buffer[pos] not in ',]':
+            skip_whitespace()
+        delimiter = buffer[pos:pos + 1]
+        if delimiter == ',':
+            pos += 1
+        elif recover:
+            # A missing comma or garbage is dealt with when decoding the next element
+            continue
+        elif delimiter == ']':
+            finish_array()
+            return
+        else:
+            raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+
+    if skipped:
+        print(f"{YELLOW}[WARNING]{RESET} Skipped {skipped} malformed section(s) while recovering")
 
 # Function to convert JSON to NDJSON with line-by-line processing for malformed JSONs
 def convert_json_to_ndjson(json_file_path, ndjson_file_path):
     try:
-        # Try standard JSON processing first
-        with open(json_file_path, 'r') as json_file:
-            data = json.load(json_file)
-        
-        with open(ndjson_file_path, 'w') as ndjson_file:
-            schema = None
-            
-            if isinstance(data, list) and len(data) > 0:
-                # Check if first element is an array of field names or a data object
-                first_element = data[0]
-                
-                # If first element is an array, it's likely a header with field names
-                if isinstance(first_element, list) and all(isinstance(x, str) for x in first_element):
-                    # We have a list of field names as the first element
-                    schema = extract_schema_from_header(first_element)
-                    print(f"{BLUE}[INFO]{RESET} Found header array of field names")
-                    
-                    # Process remaining elements (starting from index 1)
-                    valid_count = 0
-                    for i, item in enumerate(data[1:], 1):
-                        # For arrays, we can't directly apply field validation
-                        # but we can still clean string values
-                        if isinstance(item, list):
-                            # Clean string values in the array
-                            for j, value in enumerate(item):
-                                if isinstance(value, str):
-                                    item[j] = value.strip()
-                            ndjson_file.write(json.dumps(item) + '\n')
-                            valid_count += 1
-                        else:
-                            # If it's not an array, try to validate as a regular object
-                            clean_object_values(item)
-                            if not schema or not ENABLE_SCHEMA_VALIDATION or validate_object(item, schema):
-                                ndjson_file.write(json.dumps(item) + '\n')
-                                valid_count += 1
-                    
-                    print(f"{BLUE}[INFO]{RESET} Converted list data, used field name header, wrote {GREEN}{valid_count}{RESET} records")
-                else:
-                    # First element is an ordinary data object or dictionary
-                    schema = extract_schema_from_header(first_element)
-                    print(f"{BLUE}[INFO]{RESET} Using first object as schema template")
-                    
-                    # Write the data, skipping the header
-                    valid_count = 0
-                    for item in data[1:]:  # Start from index 1 to skip header
-                        # Clean and validate against schema if available
-                        if schema and ENABLE_SCHEMA_VALIDATION:
-                            clean_object_values(item)  # Clean values regardless of validation
-                            if not validate_object(item, schema):
-                                print(f"{YELLOW}[WARNING]{RESET} Item failed schema validation, skipping")
-                                continue
-                        else:
-                            clean_object_values(item)  # Clean values even without validation
-                        
-                        ndjson_file.write(json.dumps(item) + '\n')
-                        valid_count += 1
-                    
-                    print(f"{BLUE}[INFO]{RESET} Converted list data, used first object as schema, wrote {GREEN}{valid_count}{RESET} records")
-            elif isinstance(data, list) and len(data) == 0:
-                print(f"{YELLOW}[WARNING]{RESET} Empty list in JSON file")
+        with open(json_file_path, 'r') as json_file, \
+                open(ndjson_file_path, 'wb', buffering=WRITE_BUFFER_SIZE) as ndjson_file:
+            if STREAMING_PARSER and peek_first_char(json_file) == '[':
+                # Walk the top-level array element by element, writing records as they are parsed
+                write_list_records(iter_json_array(json_file), ndjson_file)
             else:
-                # For non-list objects, clean and write
-                clean_object_values(data)
-                ndjson_file.write(json.dumps(data) + '\n')
-                print(f"{BLUE}[INFO]{RESET} Converted single object data")
+                # Try standard JSON processing first
+                data = codec.loads(json_file.read())
+
+                if isinstance(data, list):
+                    write_list_records(iter(data), ndjson_file)
+                else:
+                    # For non-list objects, clean and write
+                    clean_object_values(data)
+                    ndjson_file.write(codec.encode_line(data))
+                    print(f"{BLUE}[INFO]{RESET} Converted single object data")
     except json.JSONDecodeError as e:
         print(f"{YELLOW}[WARNING]{RESET} JSON parsing error: {str(e)}")
         print(f"{BLUE}[INFO]{RESET} Attempting line-by-line processing...")
@@ -143,6 +273,66 @@ def convert_json_to_ndjson(json_file_path, ndjson_file_path):
         else:
             raise Exception("Failed to recover any valid JSON objects")
 
+# Write the elements of a top-level list as NDJSON, using the first element as the schema;
+# returns the number of records written
+def write_list_records(elements, ndjson_file):
+    schema = None
+    no_elements = object()
+    first_element = next(elements, no_elements)
+
+    valid_count = 0
+    if first_element is no_elements:
+        print(f"{YELLOW}[WARNING]{RESET} Empty list in JSON file")
+    # If first element is an array, it's likely a header with field names
+    elif isinstance(first_element, list) and all(isinstance(x, str) for x in first_element):
+        # We have a list of field names as the first element
+        schema = extract_schema_from_header(first_element)
+        validate = compile_validator(schema) if schema and ENABLE_SCHEMA_VALIDATION else None
+        print(f"{BLUE}[INFO]{RESET} Found header array of field names")
+        
+        # Process remaining elements
+        for item in elements:
+            # For arrays, we can't directly apply field validation
+            # but we can still clean string values
+            if isinstance(item, list):
+                # Clean string values in the array
+                for j, value in enumerate(item):
+                    if isinstance(value, str):
+                        item[j] = value.strip()
+                ndjson_file.write(codec.encode_line(item))
+                valid_count += 1
+            else:
+                # If it's not an array, try to validate as a regular object
+                if validate is None:
+                    clean_object_values(item)
+                elif not validate(item):
+                    continue
+                ndjson_file.write(codec.encode_line(item))
+                valid_count += 1
+        
+        print(f"{BLUE}[INFO]{RESET} Converted list data, used field name header, wrote {GREEN}{valid_count}{RESET} records")
+    else:
+        # First element is an ordinary data object or dictionary
+        schema = extract_schema_from_header(first_element)
+        validate = compile_validator(schema) if schema and ENABLE_SCHEMA_VALIDATION else None
+        print(f"{BLUE}[INFO]{RESET} Using first object as schema template")
+        
+        # Write the data, skipping the header
+        for item in elements:
+            # Clean and validate against schema if available
+            if validate is None:
+                clean_object_values(item)  # Clean values even without validation
+            elif not validate(item):
+                print(f"{YELLOW}[WARNING]{RESET} Item failed schema validation, skipping")
+                continue
+            
+            ndjson_file.write(codec.encode_line(item))
+            valid_count += 1
+        
+        print(f"{BLUE}[INFO]{RESET} Converted list data, used first object as schema, wrote {GREEN}{valid_count}{RESET} records")
+
+    return valid_count
+
 # Extract schema from the header (first element, which is an array of field names)
 def extract_schema_from_header(header):
     schema = {
@@ -176,114 +366,116 @@ def extract_schema_from_header(header):
         print(f"{YELLOW}[WARNING]{RESET} Header is not a dictionary or list, cannot extract schema")
         return None
 
-# Clean and validate an object against field names or schema
-def validate_object(obj, schema):
-    # First clean the object (trim strings)
-    clean_object_values(obj)
-    
-    # Case 1: Schema contains array of field names
-    # For this case, we'll validate that the object has values for these array indexes
-    if isinstance(obj, list) and schema["required_keys"] and isinstance(schema["required_keys"][0], str):
-        # Here we're checking a list object against field name strings, 
-        # which doesn't really make sense. We'll return True as we can't validate.
-        return True
-    
-    # Case 2: Schema contains field names and object is a dictionary
-    # For this case, we don't check required keys since the data format is different
-    # We just make sure it's a valid object with some data
-    elif isinstance(obj, list) and len(obj) > 0:
-        return True  # Accept any non-empty array
-    
-    # Case 3: Traditional case - object is a dictionary, schema has required keys
-    elif isinstance(obj, dict):
-        # Check if all required keys are present (only if they're strings)
-        required_keys = [k for k in schema["required_keys"] if isinstance(k, str)]
-        for key in required_keys:
-            if key not in obj:
-                return False
-        
+# Build the cleaner and validator for one schema. The key set, type checks and the fields that
+# need cleaning are worked out once here, so each record only pays for the checks themselves.
+# The returned function cleans the record (trims strings) and returns whether it matches the
+# schema, converting values to the expected type where it can.
+def compile_validator(schema):
+    # Only string field names can be required keys of a dictionary
+    required_keys = frozenset(key for key in schema["required_keys"] if isinstance(key, str))
+    key_types = tuple(schema["key_types"].items())
+
+    # A record with exactly the schema's keys only has strings to trim in the fields the schema
+    # holds strings in and nested values in its list and dict fields; numbers, booleans and nulls
+    # are left alone. Fields of no known type are cleaned whatever they hold, and a value of an
+    # unexpected type is cleaned before it is converted below.
+    string_keys = tuple(key for key, expected_type in key_types if expected_type is str)
+    nested_keys = tuple(key for key, expected_type in key_types if expected_type in (list, dict))
+    untyped_keys = tuple(key for key in required_keys if key not in schema["key_types"])
+
+    def validate(obj):
+        # Arrays (rows under a field name header) and scalars can't be checked against the schema
+        if not isinstance(obj, dict):
+            return True
+
+        # Check if all required keys are present
+        if not required_keys <= obj.keys():
+            return False
+
+        if len(obj) == len(required_keys):
+            for key in string_keys:
+                value = obj[key]
+                if type(value) is str:
+                    stripped = value.strip()
+                    if stripped is not value:
+                        obj[key] = stripped
+            for key in nested_keys:
+                value = obj[key]
+                if type(value) is list:
+                    clean_list_values(value)
+                elif type(value) is dict:
+                    clean_object_values(value)
+            for key in untyped_keys:
+                obj[key] = clean_value(obj[key])
+        else:
+            # Keys the schema doesn't know could hold anything
+            clean_object_values(obj)
+
         # Check data types for keys that exist in the object
-        for key, expected_type in schema["key_types"].items():
-            if key in obj and obj[key] is not None and not isinstance(obj[key], expected_type):
+        for key, expected_type in key_types:
+            value = obj.get(key)
+            if value is not None and not isinstance(value, expected_type):
                 # Try to convert to the expected type
                 try:
-                    obj[key] = expected_type(obj[key])
+                    obj[key] = expected_type(clean_value(value))
                 except (ValueError, TypeError):
                     return False
-    
-    return True
+        return True
+
+    return validate
 
 # Function to clean string values in an object (trim whitespace)
 def clean_object_values(obj):
     if not isinstance(obj, dict):
         return
     
+    # Parsed JSON only holds exact built-in types, so type() is compared directly instead of a
+    # chain of isinstance() calls; strip() returns the same string when there is nothing to trim
     for key, value in obj.items():
-        if isinstance(value, str):
-            obj[key] = value.strip()
-        elif isinstance(value, list):
-            for i, item in enumerate(value):
-                if isinstance(item, str):
-                    value[i] = item.strip()
-                elif isinstance(item, dict):
-                    clean_object_values(item)
-        elif isinstance(value, dict):
+        value_type = type(value)
+        if value_type is str:
+            stripped = value.strip()
+            if stripped is not value:
+                obj[key] = stripped
+        elif value_type is list:
+            clean_list_values(value)
+        elif value_type is dict:
             clean_object_values(value)
 
-# Process corrupted JSON files line by line, attempting to extract valid records
+# Function to clean the items of a list: strings are trimmed and objects cleaned, as in an object
+def clean_list_values(items):
+    for i, item in enumerate(items):
+        item_type = type(item)
+        if item_type is str:
+            stripped = item.strip()
+            if stripped is not item:
+                items[i] = stripped
+        elif item_type is dict:
+            clean_object_values(item)
+
+# Function to clean a single value, returning it trimmed if it is a string
+def clean_value(value):
+    value_type = type(value)
+    if value_type is str:
+        return value.strip()
+    if value_type is list:
+        clean_list_values(value)
+    elif value_type is dict:
+        clean_object_values(value)
+    return value
+
+# Process corrupted JSON files in a single pass, writing every record that can be recovered
 def process_corrupted_json(json_file_path, ndjson_file_path):
-    valid_count = 0
-    schema = get_schema_for_file(json_file_path)
-    
-    with open(json_file_path, 'r') as f:
-        content = f.read()
-    
-    # Extract what might be valid JSON objects (basic approach)
-    # Looking for patterns like {...} with some reasonable constraints
-    import re
-    potential_objects = []
-    
-    # Try to detect if this is a JSON array with objects
-    if content.strip().startswith('[') and '},' in content:
-        # Split by "},", then add the closing brace back
-        parts = content.split('},')
-        for i, part in enumerate(parts[:-1]):  # All except the last
-            if part.strip().startswith('{'):
-                potential_objects.append(part + '}')
-        # Handle the last part
-        if parts[-1].strip().startswith('{') and parts[-1].strip().endswith('}'):
-            potential_objects.append(parts[-1])
-    
-    with open(ndjson_file_path, 'w') as out_file:
-        # Try to parse each potential object
-        for obj_str in potential_objects:
-            try:
-                # Skip the first object (header) if this looks like an array
-                if valid_count == 0 and content.strip().startswith('['):
-                    valid_count += 1
-                    continue
-                
-                # Clean up the string a bit
-                obj_str = obj_str.strip()
-                if not obj_str.startswith('{'):
-                    obj_str = '{' + obj_str
-                if not obj_str.endswith('}'):
-                    obj_str = obj_str + '}'
-                
-                # Try to parse it
-                obj = json.loads(obj_str)
-                
-                # Validate against schema if we have required keys
-                if schema["required_keys"] and not validate_object(obj, schema):
-                    print(f"{YELLOW}[WARNING]{RESET} Object failed schema validation, skipping")
-                    continue
-                
-                out_file.write(json.dumps(obj) + '\n')
-                valid_count += 1
-            except json.JSONDecodeError:
-                continue
-    
-    return valid_count
+    # Undecodable bytes are replaced so they only cost the record they appear in
+    with open(json_file_path, 'r', errors='replace') as json_file, open(ndjson_file_path, 'wb', buffering=WRITE_BUFFER_SIZE) as out_file:
+        if peek_first_char(json_file) != '[':
+            # Only an array of records can be recovered element by element
+            return 0
+        return write_list_records(iter_json_array(json_file, recover=True), out_file)
+
+# Function to get the NDJSON file a JSON file is converted to
+def ndjson_path(file_path, dir_path):
+    return os.path.join(dir_path, 'ndjsons', os.path.basename(file_path).replace('.json', '.ndjson'))
 
 # Function to process new files
 def process_file(file_path, dir_path):
@@ -294,31 +486,99 @@ def process_file(file_path, dir_path):
         if not os.path.exists(ndjson_dir):
             os.makedirs(ndjson_dir)
             
-        ndjson_file_path = os.path.join(ndjson_dir, os.path.basename(file_path).replace('.json', '.ndjson'))
+        ndjson_file_path = ndjson_path(file_path, dir_path)
             
         if not os.path.exists(ndjson_file_path):
+            start_time = time.perf_counter()
             convert_json_to_ndjson(file_path, ndjson_file_path)
-            print(f"{GREEN}[SUCCESS]{RESET} Processed: {file_path} -> {ndjson_file_path}")
+            elapsed = time.perf_counter() - start_time
+            print(f"{GREEN}[SUCCESS]{RESET} Processed: {file_path} -> {ndjson_file_path} in {elapsed:.2f}s")
         else:
             print(f"{YELLOW}[WARNING]{RESET} File already exists: {ndjson_file_path}")
     except Exception as e:
         print(f"{RED}[ERROR]{RESET} Error processing {file_path}: {str(e)}")
 
+# Process pool shared by all directory handlers. Conversion is CPU-bound Python, so processes
+# rather than threads; submit() blocks once MAX_PENDING_CONVERSIONS files are waiting, which
+# holds back the watchers instead of queueing an unbounded backlog. A worker that dies (killed,
+# out of memory) breaks the whole executor, so it is replaced and the files it held are
+# resubmitted, each once.
+class ConversionPool:
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.slots = BoundedSemaphore(max_pending or self.workers * 2)
+        self.lock = Lock()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        # Start the workers now, before the observer threads exist, so they aren't forked mid-lock
+        self.executor.submit(os.getpid).result()
+
+    def submit(self, file_path, dir_path):
+        self.slots.acquire()
+        self.start(file_path, dir_path, retries=1)
+
+    # Function to hand a file that holds a slot to the current executor
+    def start(self, file_path, dir_path, retries):
+        while True:
+            executor = self.executor
+            try:
+                future = executor.submit(process_file, file_path, dir_path)
+                break
+            except BrokenProcessPool:
+                self.replace(executor)
+            except Exception as e:
+                self.slots.release()
+                print(f"{RED}[ERROR]{RESET} Error processing {file_path}: {str(e)}")
+                return
+        future.add_done_callback(lambda done: self.finished(done, executor, file_path, dir_path, retries))
+
+    def finished(self, future, executor, file_path, dir_path, retries):
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool) and retries > 0:
+            self.replace(executor)
+            print(f"{YELLOW}[WARNING]{RESET} Conversion worker died, retrying {file_path}")
+            # The dead worker may have left a partial NDJSON file, which process_file would skip
+            try:
+                os.remove(ndjson_path(file_path, dir_path))
+            except FileNotFoundError:
+                pass
+            self.start(file_path, dir_path, retries - 1)
+            return
+        self.slots.release()
+        # process_file reports its own errors; this only sees failures of the pool itself
+        if error is not None:
+            print(f"{RED}[ERROR]{RESET} Error processing {file_path}: {str(error)}")
+
+    # Function to swap a broken executor for a new one, once however many files notice it
+    def replace(self, broken):
+        with self.lock:
+            if self.executor is not broken:
+                return
+            print(f"{YELLOW}[WARNING]{RESET} Conversion pool broken, starting new worker processes")
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        broken.shutdown(wait=False)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
 # Event handler for file system events
 class JsonFileHandler(FileSystemEventHandler):
-    def __init__(self, dir_path):
+    def __init__(self, dir_path, pool):
         self.dir_path = dir_path
-        self.executor = ThreadPoolExecutor(max_workers=5)
+        self.pool = pool
         
     def on_created(self, event):
         if event.is_directory:
             return
         if event.src_path.endswith('.json'):
-            self.executor.submit(process_file, event.src_path, self.dir_path)
+            # An exception here would end the observer thread and with it the watching
+            try:
+                self.pool.submit(event.src_path, self.dir_path)
+            except Exception as e:
+                print(f"{RED}[ERROR]{RESET} Error queueing {event.src_path}: {str(e)}")
 
 # Function to monitor directories
-def monitor_directory(dir_path):
-    event_handler = JsonFileHandler(dir_path)
+def monitor_directory(dir_path, pool):
+    event_handler = JsonFileHandler(dir_path, pool)
     observer = Observer()
     observer.schedule(event_handler, path=dir_path, recursive=False)
     observer.start()
@@ -334,6 +594,10 @@ def main():
     print(f"\n{BOLD}====== JSON to NDJSON Converter ======{RESET}")
     print(f"{BLUE}[INFO]{RESET} Starting directory monitoring service...")
     
+    pool = ConversionPool(CONVERSION_WORKERS, MAX_PENDING_CONVERSIONS)
+    print(f"{BLUE}[INFO]{RESET} Converting with {pool.workers} worker processes, "
+          f"encoding with {codec.encoder} and decoding with {codec.decoder}")
+    
     for directory in directories:
         if not os.path.exists(directory):
             print(f"{YELLOW}[WARNING]{RESET} Directory {directory} does not exist. Creating...")
@@ -344,7 +608,7 @@ def main():
             os.makedirs(ndjson_dir)
             
         # Start monitoring each directory in a separate thread
-        monitor_thread = Thread(target=monitor_directory, args=(directory,))
+        monitor_thread = Thread(target=monitor_directory, args=(directory, pool))
         monitor_thread.daemon = True  # Allow the thread to exit when main program exits
         monitor_thread.start()
         print(f"{GREEN}[SUCCESS]{RESET} Now monitoring: {os.path.abspath(directory)}")
@@ -358,6 +622,7 @@ def main():
             time.sleep(1)
     except KeyboardInterrupt:
         print(f"\n{BLUE}[INFO]{RESET} Stopping monitoring service...")
+        pool.shutdown()
 
 if __name__ == "__main__":
     main()
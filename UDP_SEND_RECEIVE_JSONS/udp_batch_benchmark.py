@@ -0,0 +1,130 @@
+"""
+UDP Batched I/O Benchmark
+
+Measures datagram throughput on loopback for the per-datagram and batched I/O paths used by
+udp_send_json.py and udp_recv_json_V0.5.py, and prints packets/sec before and after:
+
+- send: one sendto() per datagram vs. send_batch() (sendmmsg where available)
+- receive: one recvfrom() per datagram vs. DatagramReceiver, with its default recvfrom() drain
+  loop and with recvmmsg() (use_recvmmsg, where available)
+
+The send and receive paths are loaded straight from the scripts so the benchmark always
+measures the code that is deployed. The receiver script creates its working directories on
+import, so the benchmark runs from a temporary directory.
+"""
+
+import os
+import sys
+import time
+import struct
+import socket
+import tempfile
+import importlib.util
+
+# Scripts under test
+SENDER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "udp_send_json.py")
+RECEIVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "udp_recv_json_V0.5.py")
+
+# Benchmark settings
+DATAGRAM_SIZE = 1024
+DATAGRAM_COUNT = 200000
+# Datagrams queued per receive round; must fit in the receiver's socket buffer
+RECEIVE_ROUND = 2000
+BATCH_SIZE = 32
+
+# Function to load one of the scripts as a module
+def load_script(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# Function to create a bound loopback UDP socket with a large receive buffer
+def bound_socket():
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    udp_socket.bind(("127.0.0.1", 0))
+    return udp_socket
+
+# Function to measure send packets/sec, either one datagram per syscall or batched
+def bench_send(sender, batched):
+    sink = bound_socket()
+    destination = sink.getsockname()
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    payload = os.urandom(DATAGRAM_SIZE)
+    batch = [payload] * BATCH_SIZE
+
+    start = time.perf_counter()
+    if batched:
+        for _ in range(DATAGRAM_COUNT // BATCH_SIZE):
+            sender.send_batch(udp_socket, batch, destination)
+    else:
+        for _ in range(DATAGRAM_COUNT // BATCH_SIZE * BATCH_SIZE):
+            udp_socket.sendto(payload, destination)
+    elapsed = time.perf_counter() - start
+
+    udp_socket.close()
+    sink.close()
+    return DATAGRAM_COUNT // BATCH_SIZE * BATCH_SIZE / elapsed
+
+# Function to measure receive packets/sec by draining pre-queued rounds of datagrams, with
+# "recvfrom" (one call per datagram), "loop" (DatagramReceiver default) or "mmsg" (recvmmsg)
+def bench_receive(receiver, mode):
+    udp_socket = bound_socket()
+    destination = udp_socket.getsockname()
+    source = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    payload = os.urandom(DATAGRAM_SIZE)
+    batch_receiver = receiver.DatagramReceiver(udp_socket, BATCH_SIZE, 65535, use_mmsg=(mode == "mmsg"))
+    # Loopback may drop if the socket buffer is smaller than a round, so a blocking receive gives
+    # up after 0.2s. SO_RCVTIMEO rather than settimeout(): a Python-level timeout polls before
+    # every call, which would make each drain loop wait out the timeout at the end of a round.
+    udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, struct.pack("ll", 0, 200000))
+
+    received = 0
+    elapsed = 0.0
+    while received < DATAGRAM_COUNT:
+        for _ in range(RECEIVE_ROUND):
+            source.sendto(payload, destination)
+        pending = RECEIVE_ROUND
+        start = time.perf_counter()
+        try:
+            while pending > 0:
+                if mode == "recvfrom":
+                    udp_socket.recvfrom(65535)
+                    pending -= 1
+                else:
+                    pending -= len(batch_receiver.receive())
+        except OSError:
+            pass  # Timed out (EAGAIN): the rest of the round was dropped
+        elapsed += time.perf_counter() - start
+        received += RECEIVE_ROUND - pending
+        if pending == RECEIVE_ROUND:
+            break
+
+    source.close()
+    udp_socket.close()
+    return received / elapsed if elapsed else 0.0
+
+def main():
+    work_dir = tempfile.mkdtemp(prefix="udp_batch_bench_")
+    os.chdir(work_dir)
+    sender = load_script("udp_send_json", SENDER_SCRIPT)
+    receiver = load_script("udp_recv_json", RECEIVER_SCRIPT)
+
+    print(f"\n{DATAGRAM_COUNT} datagrams of {DATAGRAM_SIZE} bytes, batch size {BATCH_SIZE}")
+    print(f"sendmmsg available: {sender._sendmmsg is not None}, recvmmsg available: {receiver._recvmmsg is not None}\n")
+
+    send_before = bench_send(sender, batched=False)
+    send_after = bench_send(sender, batched=True)
+    recv_before = bench_receive(receiver, "recvfrom")
+    recv_loop = bench_receive(receiver, "loop")
+
+    print(f"{'path':<16}{'per-datagram pkt/s':>22}{'batched pkt/s':>18}{'speedup':>10}")
+    print(f"{'send':<16}{send_before:>22,.0f}{send_after:>18,.0f}{send_after / send_before:>9.2f}x")
+    print(f"{'receive (loop)':<16}{recv_before:>22,.0f}{recv_loop:>18,.0f}{recv_loop / recv_before:>9.2f}x")
+    if receiver._recvmmsg is not None:
+        recv_mmsg = bench_receive(receiver, "mmsg")
+        print(f"{'receive (mmsg)':<16}{recv_before:>22,.0f}{recv_mmsg:>18,.0f}{recv_mmsg / recv_before:>9.2f}x")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,14 +7,45 @@ with an EOF signal sent at the end to indicate completion. A hash log of all fil
 and sent afterward for integrity verification. After transmission, all JSON files are deleted
 from the directory.
 
+In watch mode (WATCH_MODE) no signal is needed: each JSON file is sent as soon as it is fully
+written, in small batches that each carry their own manifest or hash log, and is deleted once
+acknowledged.
+
+Two wire formats are supported. The legacy stream (FILENAME, raw chunks, EOF) is what older
+receivers understand. When FRAMED_PROTOCOL is enabled every datagram carries a small binary
+header (file id, chunk sequence number, total chunk count), the receiver reassembles chunks by
+offset and answers each END frame with an ACK or a NACK listing the missing chunks, which the
+sender then retransmits selectively instead of resending the whole batch.
+
+For one-way (data diode) links the framed protocol can also add forward error correction:
+Reed-Solomon parity datagrams are sent after every group of data chunks, so the receiver can
+rebuild lost chunks without asking for a retransmit.
+
 Functions:
 - handle_signal: Sets a flag to start the file sending process upon receiving a signal.
+- TokenBucket / Pacer: Token-bucket rate limiter shared by every datagram the sender emits.
+- chunk_size_for: Returns the configured payload size, or derives it from the path MTU.
+- send_batch: Sends a list of datagrams with one sendmmsg() call where the platform supports it.
 - send_file: Sends a JSON file in chunks over UDP and signals completion with an EOF.
+- pacer_for: Returns the pacer of a destination (the main receiver or one of EXTRA_RECEIVERS).
+- FramedTransfer / TransferPeer / run_transfers: Framed transfer state (per file and per destination)
+  and the loop that interleaves several transfers over one socket, retransmitting chunks each
+  receiver NACKs.
+- send_file_framed: Sends one file using the framed protocol.
+- send_files_concurrently: Sends a batch of files as interleaved framed transfers under the global rate cap.
+- compress_file: Compresses a file with zstd or gzip ahead of a framed transfer.
+- transfer_id: Derives a framed transfer's id from the file's name, size, encoding and SHA-256.
+- fec_parity_chunks: Computes the Reed-Solomon parity chunks for one group of data chunks.
 - generate_file_hash: Generates a SHA-256 hash for a JSON file for integrity checks.
+- hash_files: Hashes a batch of files in a process pool, yielding each digest as soon as it is ready.
 - create_hash_log: Compiles hashes for all JSON files in the directory and saves to a log file.
+- send_manifest: Sends the batch manifest (names, sizes and hashes) ahead of the files.
 - send_hash_log: Sends the hash log over UDP, chunked to fit UDP packet size, with an EOF signal at the end.
 - delete_json_files: Deletes JSON files from the directory once processed.
 - process_all_files_and_hashes: Orchestrates the file and hash log sending process after the trigger signal.
+- process_files: Sends one batch of files with its manifest or hash log, then deletes the batch.
+- ReadyFileWatcher / watch_directory: Watch mode; sends each JSON file as soon as it is fully
+  written (close-write events via watchdog, or size stability) and deletes it once acknowledged.
 """
 
 import os
@@ -23,16 +54,352 @@ import time
 import hashlib
 import json
 import signal
+import struct
+import errno
+import ctypes
+import functools
+import threading
+import select
+import collections
+import concurrent.futures
+import ipaddress
+import tempfile
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional, COMPRESSION = "zstd" falls back to gzip without it
+    zstandard = None
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # optional, watch mode falls back to size-stability polling without it
+    Observer = None
+    FileSystemEventHandler = object
 
 # Path to monitor for JSON files
 directoryToWatch = "./REPORTS"
 # Path to store the hash log
 hashlogFile = "./HASH/hash_log.json"
+# Path to store the manifest (manifest-first mode)
+manifestFile = "./HASH/manifest.json"
 
 # Define the receiver IP and port
 receiverIP = "192.168.1.X"
 receiverPort = 60000
 
+# Further receivers (e.g. a second SOC collector, or a multicast group) that get every file as
+# well, as (ip, port) tuples. Each file is read, hashed and framed once and sent to every
+# receiver, each paced by its own token bucket: RECEIVER_RATES maps a receiver to its rate in
+# bytes/sec (default SEND_RATE_BYTES_PER_SEC). Multicast groups can't acknowledge, so framed
+# transfers to them are always one-way (consider FEC_PARITY_CHUNKS). Receivers join a group
+# through multicast_groups in udp_recv_json_V0.5.py.
+EXTRA_RECEIVERS = []
+RECEIVER_RATES = {}
+MULTICAST_TTL = 1
+
+# Processes used to hash a batch (None = one per CPU core) and the read size per hash update
+HASH_WORKERS = None
+HASH_READ_SIZE = 1024 * 1024
+
+# Framed transfer protocol (sequence numbers + NACK-driven selective retransmit).
+# Leave False while sites still run receivers that only understand the legacy stream.
+FRAMED_PROTOCOL = False
+# Seconds to wait for an ACK/NACK after each END frame
+ACK_TIMEOUT = 0.5
+# END frames sent without any answer before assuming a one-way link and moving on
+ACK_TIMEOUT_RETRIES = 3
+# Upper bound on NACK/retransmit rounds per file
+MAX_RETRANSMIT_ROUNDS = 20
+# Set False on a one-way (diode) link: nothing can come back, so instead of waiting for
+# ACKs the header and END frame are simply repeated END_REPEAT times.
+WAIT_FOR_ACK = True
+END_REPEAT = 3
+# On a one-way link the header is also repeated every HEADER_REPEAT_CHUNKS datagrams of the first
+# pass: a receiver that lost it only buffers max_pending_chunks (1024) chunks until the next copy.
+HEADER_REPEAT_CHUNKS = 256
+
+# Manifest-first mode (framed protocol only): hash the whole batch, send a manifest with every
+# file's name, size and hash, then the files. The receiver verifies and forwards
+# each file as soon as it completes, and the hash log is not sent afterwards.
+MANIFEST_FIRST = False
+
+# Framed files in flight at once during a batch, interleaved over one socket under the
+# global pacer so the link stays busy between files. 1 sends them one after another.
+CONCURRENT_TRANSFERS = 8
+
+# Per-file compression (framed protocol only): "zstd", "gzip" or None. Files are compressed to
+# a temp file before sending and the receiver restores the original, whose hash is what the
+# hash log is checked against. Files that don't shrink are sent as they are.
+COMPRESSION = None
+COMPRESSION_LEVEL = 3
+
+# Watch mode: instead of waiting for SIGUSR1, send each JSON file as soon as it is fully written.
+# A file is ready once it has been closed after writing (needs the watchdog package) or its size
+# and mtime have not changed for WATCH_STABLE_SECONDS. Ready files go out in batches of up to
+# WATCH_BATCH_SIZE, each with its own manifest (framed protocol) or hash log, and are deleted once
+# every receiver has acknowledged them; unacknowledged files are retried after WATCH_RETRY_DELAY.
+WATCH_MODE = False
+WATCH_POLL_INTERVAL = 0.5
+WATCH_STABLE_SECONDS = 2.0
+WATCH_BATCH_SIZE = 32
+WATCH_RETRY_DELAY = 30
+
+# Forward error correction (framed protocol only). FEC_PARITY_CHUNKS parity datagrams are sent
+# per FEC_GROUP_SIZE data chunks and the receiver can rebuild up to that many lost chunks in
+# each group. Overhead is FEC_PARITY_CHUNKS / FEC_GROUP_SIZE (e.g. 2/16 = 12.5%); 0 disables FEC.
+# FEC_GROUP_SIZE + FEC_PARITY_CHUNKS must not exceed 256.
+FEC_GROUP_SIZE = 16
+FEC_PARITY_CHUNKS = 0
+
+# Sender pacing (token bucket with burst allowance), shared by every datagram.
+# Set a rate to None to leave that dimension unlimited.
+SEND_RATE_BYTES_PER_SEC = 1000000
+SEND_RATE_PACKETS_PER_SEC = None
+PACER_BURST_BYTES = 64 * 1024
+PACER_BURST_PACKETS = 64
+
+# File bytes carried per datagram. 1024 is what V0.4 receivers expect (they read 1024-byte
+# datagrams); "auto" sizes chunks to the path MTU so a 9000-byte jumbo frame link carries
+# ~8.9 KB per datagram. Any explicit value up to MAX_CHUNK_SIZE is also accepted.
+CHUNK_SIZE = 1024
+MAX_CHUNK_SIZE = 65507 - 17
+# Chunk size used when "auto" cannot query the path MTU
+FALLBACK_CHUNK_SIZE = 1024
+
+# Datagrams handed to the kernel per sendmmsg() call
+SEND_BATCH_SIZE = 32
+
+# Frame layout: magic, frame type, file id, chunk sequence number, total chunk count
+FRAME_MAGIC = b"UDPF"
+FRAME_HEADER = struct.Struct("!4sBIII")
+FRAME_DATA = 1
+FRAME_END = 2
+FRAME_ACK = 3
+FRAME_NACK = 4
+FRAME_RESEND_HEADER = 5
+FRAME_PARITY = 6
+
+# Token bucket that lets the balance go negative; the debt is paid back by sleeping,
+# so oversleeping under scheduler jitter is compensated on the next datagram.
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    # Take tokens and return how long the caller must wait to stay under the rate
+    def consume(self, amount):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+# Paces datagrams to a bytes/s and/or packets/s budget and counts what was sent
+class Pacer:
+    # Waits shorter than this are carried over as debt instead of sleeping
+    MIN_SLEEP = 0.0005
+
+    def __init__(self, bytes_per_sec=None, packets_per_sec=None, burst_bytes=64 * 1024, burst_packets=64):
+        self.byte_bucket = TokenBucket(bytes_per_sec, burst_bytes) if bytes_per_sec else None
+        self.packet_bucket = TokenBucket(packets_per_sec, burst_packets) if packets_per_sec else None
+        self.bytes_sent = 0
+        self.packets_sent = 0
+
+    def wait(self, nbytes, npackets=1):
+        delay = 0.0
+        if self.byte_bucket:
+            delay = max(delay, self.byte_bucket.consume(nbytes))
+        if self.packet_bucket:
+            delay = max(delay, self.packet_bucket.consume(npackets))
+        if delay > self.MIN_SLEEP:
+            time.sleep(delay)
+
+    def sendto(self, udp_socket, data, destination):
+        self.wait(len(data))
+        udp_socket.sendto(data, destination)
+        self.bytes_sent += len(data)
+        self.packets_sent += 1
+
+    def send_batch(self, udp_socket, datagrams, destination):
+        self.wait(sum(len(d) for d in datagrams), len(datagrams))
+        send_batch(udp_socket, datagrams, destination)
+        self.bytes_sent += sum(len(d) for d in datagrams)
+        self.packets_sent += len(datagrams)
+
+pacer = Pacer(SEND_RATE_BYTES_PER_SEC, SEND_RATE_PACKETS_PER_SEC, PACER_BURST_BYTES, PACER_BURST_PACKETS)
+destination_pacers = {}
+
+# Function to get the pacer for a destination: the global pacer for the main receiver, and one
+# pacer per extra receiver so each link is held to its own rate
+def pacer_for(destination):
+    if destination == (receiverIP, receiverPort):
+        return pacer
+    destination_pacer = destination_pacers.get(destination)
+    if destination_pacer is None:
+        destination_pacer = Pacer(RECEIVER_RATES.get(destination, SEND_RATE_BYTES_PER_SEC), SEND_RATE_PACKETS_PER_SEC,
+                                  PACER_BURST_BYTES, PACER_BURST_PACKETS)
+        destination_pacers[destination] = destination_pacer
+    return destination_pacer
+
+# Function to check whether a destination is a multicast group
+def is_multicast(destination):
+    try:
+        return ipaddress.ip_address(destination[0]).is_multicast
+    except ValueError:
+        return False  # Host name
+
+# Function to open the sending socket (multicast TTL set in case a destination is a group)
+def open_udp_socket():
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MULTICAST_TTL)
+    return udp_socket
+
+# ctypes mirrors of the Linux structures used by sendmmsg()
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+try:
+    _sendmmsg = ctypes.CDLL(None, use_errno=True).sendmmsg
+    _sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    _sendmmsg.restype = ctypes.c_int
+except (OSError, AttributeError, TypeError):
+    _sendmmsg = None  # Not Linux/glibc: send_batch falls back to a sendto() loop
+
+# sendmmsg() structures and a contiguous copy buffer, allocated once and reused for every batch
+class _SendBatch:
+    def __init__(self, capacity, slot_size):
+        self.capacity = capacity
+        self.slot_size = slot_size
+        self.buffer = bytearray(capacity * slot_size)
+        self.view = memoryview(self.buffer)
+        self.name = ctypes.create_string_buffer(128)
+        self.destination = None
+        self.iovecs = (_IOVec * capacity)()
+        self.messages = (_MMsgHdr * capacity)()
+        base = ctypes.addressof(ctypes.c_char.from_buffer(self.buffer))
+        for i in range(capacity):
+            header = self.messages[i].msg_hdr
+            header.msg_name = ctypes.addressof(self.name)
+            header.msg_iov = ctypes.pointer(self.iovecs[i])
+            header.msg_iovlen = 1
+        # Rewrites the whole iovec array (fixed slot addresses, new lengths) with one pack_into()
+        self.iovec_layout = struct.Struct("@" + "PN" * capacity)
+        self.iovec_values = [0] * (2 * capacity)
+        self.iovec_values[0::2] = [base + i * slot_size for i in range(capacity)]
+
+    def send(self, udp_socket, datagrams, destination):
+        if destination != self.destination:
+            raw_name = sockaddr_bytes(destination)
+            ctypes.memmove(self.name, raw_name, len(raw_name))
+            for message in self.messages:
+                message.msg_hdr.msg_namelen = len(raw_name)
+            self.destination = destination
+
+        values = self.iovec_values
+        for i, datagram in enumerate(datagrams):
+            offset = i * self.slot_size
+            self.view[offset:offset + len(datagram)] = datagram
+            values[2 * i + 1] = len(datagram)
+        self.iovec_layout.pack_into(self.iovecs, 0, *values)
+
+        count = len(datagrams)
+        sent = 0
+        while sent < count:
+            result = _sendmmsg(udp_socket.fileno(), ctypes.byref(self.messages, sent * ctypes.sizeof(_MMsgHdr)),
+                               count - sent, 0)
+            if result >= 0:
+                sent += result
+                continue
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                continue
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                # Socket has a timeout set (non-blocking fd); let sendto() do the waiting
+                for datagram in datagrams[sent:]:
+                    udp_socket.sendto(datagram, destination)
+                return
+            raise OSError(err, os.strerror(err))
+
+_send_batches = threading.local()
+
+# Function to encode a destination as a raw sockaddr for sendmmsg()
+@functools.lru_cache(maxsize=64)
+def sockaddr_bytes(destination):
+    family, _, _, _, address = socket.getaddrinfo(destination[0], destination[1], type=socket.SOCK_DGRAM)[0]
+    if family == socket.AF_INET:
+        return (struct.pack("=H", family) + struct.pack("!H", address[1])
+                + socket.inet_aton(address[0]) + bytes(8))
+    return (struct.pack("=H", family) + struct.pack("!HI", address[1], address[2])
+            + socket.inet_pton(socket.AF_INET6, address[0]) + struct.pack("=I", address[3]))
+
+# Function to send several datagrams to one destination, batching the syscalls where possible
+def send_batch(udp_socket, datagrams, destination):
+    if _sendmmsg is None or len(datagrams) == 1:
+        for datagram in datagrams:
+            udp_socket.sendto(datagram, destination)
+        return
+
+    largest = max(len(datagram) for datagram in datagrams)
+    batch = getattr(_send_batches, "batch", None)
+    if batch is None or batch.capacity < len(datagrams) or batch.slot_size < largest:
+        batch = _SendBatch(max(SEND_BATCH_SIZE, len(datagrams)), max(2048, largest))
+        _send_batches.batch = batch
+    batch.send(udp_socket, datagrams, destination)
+
+# Function to work out the payload size for a destination
+@functools.lru_cache(maxsize=64)
+def chunk_size_for(destination):
+    if CHUNK_SIZE != "auto":
+        return max(1, min(int(CHUNK_SIZE), MAX_CHUNK_SIZE))
+
+    # Linux reports the route (or cached path) MTU on a connected socket with PMTU discovery on
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        probe.setsockopt(socket.IPPROTO_IP, getattr(socket, "IP_MTU_DISCOVER", 10),
+                         getattr(socket, "IP_PMTUDISC_DO", 2))
+        probe.connect(destination)
+        mtu = probe.getsockopt(socket.IPPROTO_IP, getattr(socket, "IP_MTU", 14))
+    except OSError as e:
+        print(f"Could not determine path MTU to {destination[0]}: {e}, using {FALLBACK_CHUNK_SIZE}-byte chunks")
+        return FALLBACK_CHUNK_SIZE
+    finally:
+        probe.close()
+
+    # IPv4 header (20) + UDP header (8) + frame header
+    chunk_size = min(mtu - 28 - FRAME_HEADER.size, MAX_CHUNK_SIZE)
+    print(f"Path MTU to {destination[0]} is {mtu}, using {chunk_size}-byte chunks")
+    return chunk_size
+
+# Function to format the rate achieved since the given pacer counters were sampled
+def achieved_rate(start_time, start_bytes, start_packets):
+    return format_rate(pacer.bytes_sent - start_bytes, pacer.packets_sent - start_packets,
+                       time.monotonic() - start_time)
+
+# Function to format a byte/packet count over a duration as a rate
+def format_rate(nbytes, npackets, elapsed):
+    elapsed = max(elapsed, 1e-6)
+    return f"{nbytes / elapsed / 1e6:.2f} MB/s, {npackets / elapsed:.0f} pkt/s"
+
 # Flag for JSON access based on signal
 JSONAccess = False
 
@@ -46,119 +413,670 @@ def handle_signal(signum, frame):
 signal.signal(signal.SIGUSR1, handle_signal)
 
 # Function to send a file via UDP
-def send_file(file_path, receiverIP, receiverPort):
-    chunk_size = 1024  # Define the chunk size (in bytes)
-    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+def send_file(file_path, receiverIP, receiverPort, extra_destinations=()):
+    destinations = [(receiverIP, receiverPort), *extra_destinations]
+    chunk_size = min(chunk_size_for(destination) for destination in destinations)  # Define the chunk size (in bytes)
+    udp_socket = open_udp_socket()
 
     filename = os.path.basename(file_path)
+    started = (time.monotonic(), pacer.bytes_sent, pacer.packets_sent)
     # Send the filename before the file data
-    udp_socket.sendto(f"FILENAME:{filename}".encode(), (receiverIP, receiverPort))
-    time.sleep(0.001)  # Short delay to ensure the receiver processes the filename
+    for destination in destinations:
+        pacer_for(destination).sendto(udp_socket, f"FILENAME:{filename}".encode(), destination)
 
     # Open the file in binary mode
     with open(file_path, 'rb') as file:
         while True:
-            chunk = file.read(chunk_size)
-            if not chunk:
+            batch = []
+            while len(batch) < SEND_BATCH_SIZE:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    break
+                batch.append(chunk)
+            if not batch:
                 break
-            udp_socket.sendto(chunk, (receiverIP, receiverPort))
-            time.sleep(0.001)  # Sleep to avoid flooding
+            # Each chunk is read once and sent to every destination
+            for destination in destinations:
+                pacer_for(destination).send_batch(udp_socket, batch, destination)
 
     # Send EOF message to signal the end of the file
-    udp_socket.sendto(b"EOF", (receiverIP, receiverPort))
-    print(f"File '{filename}' sent via UDP")
+    for destination in destinations:
+        pacer_for(destination).sendto(udp_socket, b"EOF", destination)
+    print(f"File '{filename}' sent via UDP ({achieved_rate(*started)})")
 
     udp_socket.close()
 
+# Function to build a framed datagram
+def build_frame(frame_type, file_id, seq, total, payload=b""):
+    return FRAME_HEADER.pack(FRAME_MAGIC, frame_type, file_id, seq, total) + payload
+
+# Function to parse a framed datagram, returns None for anything that is not a frame
+def parse_frame(data):
+    if len(data) < FRAME_HEADER.size or not data.startswith(FRAME_MAGIC):
+        return None
+    _, frame_type, file_id, seq, total = FRAME_HEADER.unpack_from(data)
+    return frame_type, file_id, seq, total, data[FRAME_HEADER.size:]
+
+# GF(256) arithmetic (polynomial 0x11d) for the Reed-Solomon parity
+GF_EXP = [0] * 512
+GF_LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    GF_EXP[_i] = _x
+    GF_LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= 0x11d
+for _i in range(255, 512):
+    GF_EXP[_i] = GF_EXP[_i - 255]
+
+def gf_mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return GF_EXP[GF_LOG[a] + GF_LOG[b]]
+
+# Function returning a bytes.translate() table that multiplies every byte by a constant
+@functools.lru_cache(maxsize=256)
+def gf_mul_table(constant):
+    return bytes(gf_mul(constant, x) for x in range(256))
+
+# Function returning the Cauchy matrix coefficient of data chunk i in parity chunk j
+def fec_coefficient(j, i, group_size):
+    return GF_EXP[255 - GF_LOG[(group_size + j) ^ i]]
+
+# Function to derive a framed transfer's id from its header fields (name, kind, size, chunking
+# and encoding) and the SHA-256 of the original file. The same file sent the same way always
+# gets the same id, so a retry (watch mode, SIGUSR1, the next batch) lets a receiver that
+# restarted mid-transfer resume its partial file, and one that already completed it just ACKs.
+def transfer_id(header, file_hash):
+    key = json.dumps({**header, "sha256": file_hash}, sort_keys=True).encode()
+    return int.from_bytes(hashlib.sha256(key).digest()[:4], "big")
+
+# Function to compute the parity chunks for one group of data chunks
+def fec_parity_chunks(chunks, group_size, parity_count):
+    length = max(len(chunk) for chunk in chunks)
+    padded = [chunk.ljust(length, b"\0") for chunk in chunks]
+    parity = []
+    for j in range(parity_count):
+        accumulator = 0
+        for i, chunk in enumerate(padded):
+            accumulator ^= int.from_bytes(chunk.translate(gf_mul_table(fec_coefficient(j, i, group_size))), "big")
+        parity.append(accumulator.to_bytes(length, "big"))
+    return parity
+
+# Function to compress a file into an anonymous temp file with COMPRESSION. Returns the temp
+# file (positioned anywhere) and the encoding name, or (None, None) if compression didn't help.
+def compress_file(file_path):
+    encoding = COMPRESSION
+    if encoding == "zstd" and zstandard is None:
+        print("Warning: zstandard is not installed, compressing with gzip instead")
+        encoding = "gzip"
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compressobj()
+    elif encoding == "gzip":
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    else:
+        print(f"Warning: unknown COMPRESSION '{COMPRESSION}', sending uncompressed")
+        return None, None
+
+    compressed = tempfile.TemporaryFile()
+    with open(file_path, 'rb') as file:
+        while True:
+            block = file.read(HASH_READ_SIZE)
+            if not block:
+                break
+            compressed.write(compressor.compress(block))
+    compressed.write(compressor.flush())
+    compressed.flush()
+
+    original_size = os.path.getsize(file_path)
+    compressed_size = compressed.tell()
+    if compressed_size >= original_size:
+        compressed.close()
+        return None, None
+    print(f"Compressed '{os.path.basename(file_path)}' with {encoding}: {original_size} -> "
+          f"{compressed_size} bytes ({compressed_size / max(original_size, 1):.0%})")
+    return compressed, encoding
+
+# State of one framed file transfer: the file, its header and the first pass over its chunks,
+# which is read and framed once and sent to every destination. Transfers are driven by
+# run_transfers, which can interleave several of them over one socket.
+class FramedTransfer:
+    def __init__(self, file_path, destinations, kind="file", manifest_id=None, file_hash=None):
+        self.file_path = file_path
+        self.chunk_size = min(chunk_size_for(destination) for destination in destinations)
+        self.filename = os.path.basename(file_path)
+        self.file_size = os.path.getsize(file_path)
+        self.file = None  # opened on first use so queued transfers don't hold descriptors
+
+        encoding = None
+        original_size = self.file_size
+        if COMPRESSION and kind == "file":
+            self.file, encoding = compress_file(file_path)
+            if self.file is not None:
+                self.file_size = os.fstat(self.file.fileno()).st_size
+        self.total = (self.file_size + self.chunk_size - 1) // self.chunk_size
+
+        header = {
+            "name": self.filename,
+            "kind": kind,
+            "size": self.file_size,
+            "chunks": self.total,
+            "chunk_size": self.chunk_size,
+        }
+        if encoding:
+            header["encoding"] = encoding
+            header["original_size"] = original_size
+        self.file_id = transfer_id(header, file_hash or generate_file_hash(file_path))
+        header["id"] = self.file_id
+        if manifest_id is not None:
+            header["manifest"] = manifest_id  # transfer id of the manifest listing this file
+        if FEC_PARITY_CHUNKS:
+            header["fec"] = [FEC_GROUP_SIZE, FEC_PARITY_CHUNKS]
+        self.header_datagram = f"FILENAME:{json.dumps(header)}".encode()
+
+        self.first_pass = iter(range(self.total))
+        self.group = []
+        self.started = None
+        self.peers = [TransferPeer(self, destination) for destination in destinations]
+
+    @property
+    def done(self):
+        return all(peer.state == "done" for peer in self.peers)
+
+    @property
+    def acknowledged(self):
+        return all(peer.acknowledged for peer in self.peers)
+
+    def read_chunk(self, seq):
+        self.file.seek(seq * self.chunk_size)
+        return self.file.read(self.chunk_size)
+
+    # Up to limit first-pass DATA/PARITY datagrams, shared by every destination
+    def first_pass_datagrams(self, limit):
+        if self.started is None:
+            self.started = time.monotonic()
+        if self.file is None:
+            self.file = open(self.file_path, 'rb')
+        batch = []
+        while self.first_pass is not None and len(batch) < limit:
+            seq = next(self.first_pass, None)
+            if seq is None:
+                self.first_pass = None
+                break
+            chunk = self.read_chunk(seq)
+            batch.append(build_frame(FRAME_DATA, self.file_id, seq, self.total, chunk))
+            if FEC_PARITY_CHUNKS:
+                # Parity follows each full group (and the final partial one)
+                self.group.append(chunk)
+                if len(self.group) == FEC_GROUP_SIZE or seq == self.total - 1:
+                    group_index = seq // FEC_GROUP_SIZE
+                    for j, parity in enumerate(fec_parity_chunks(self.group, FEC_GROUP_SIZE, FEC_PARITY_CHUNKS)):
+                        batch.append(build_frame(FRAME_PARITY, self.file_id, group_index * FEC_PARITY_CHUNKS + j,
+                                                 self.total, parity))
+                    self.group = []
+        return batch
+
+    # The destination an ACK/NACK came from
+    def peer_for(self, addr):
+        for peer in self.peers:
+            if peer.destination == addr:
+                return peer
+        for peer in self.peers:
+            if peer.destination[0] == addr[0]:
+                return peer
+        return self.peers[0] if len(self.peers) == 1 else None
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+# Per-destination state of a framed transfer: retransmits owed to that receiver, its ACK/NACK
+# exchange and its own pacer.
+class TransferPeer:
+    def __init__(self, transfer, destination):
+        self.transfer = transfer
+        self.destination = destination
+        self.pacer = pacer_for(destination)
+        # Multicast groups have many (or no) receivers to answer, so they are always one-way
+        self.one_way = not WAIT_FOR_ACK or is_multicast(destination)
+        self.retransmit = collections.deque()
+        self.send_header = True
+        self.since_header = 0  # first-pass datagrams sent since the last header
+        self.state = "sending"  # sending -> awaiting (END sent) -> sending ... -> done
+        self.acknowledged = False
+        self.rounds = 0
+        self.silent_rounds = 0
+        self.retransmitted = 0
+        self.deadline = None
+        self.bytes_sent = 0
+        self.packets_sent = 0
+
+    # Datagrams owed in the current pass (header, shared first-pass batch, then retransmits);
+    # empty once only END is left
+    def next_datagrams(self, shared, limit):
+        transfer = self.transfer
+        batch = []
+        if self.send_header or (self.one_way and shared and self.since_header >= HEADER_REPEAT_CHUNKS):
+            batch.append(transfer.header_datagram)
+            self.send_header = False
+            self.since_header = 0
+        batch.extend(shared)
+        self.since_header += len(shared)
+        while transfer.first_pass is None and self.retransmit and len(batch) < limit:
+            seq = self.retransmit.popleft()
+            batch.append(build_frame(FRAME_DATA, transfer.file_id, seq, transfer.total, transfer.read_chunk(seq)))
+        return batch
+
+    # Datagrams closing the current pass; the peer then waits for an ACK/NACK
+    def end_datagrams(self):
+        transfer = self.transfer
+        end = build_frame(FRAME_END, transfer.file_id, 0, transfer.total)
+        if self.one_way:
+            # One-way link: repeat the header and END so one lost datagram can't strand the file
+            self.finish(False, f"({transfer.total} chunks, {self.rate()}, one-way)")
+            return [transfer.header_datagram, end] * END_REPEAT
+        if self.rounds >= MAX_RETRANSMIT_ROUNDS:
+            self.finish(False, None)
+            print(f"Error: file '{transfer.filename}' still incomplete{self.to()} after "
+                  f"{MAX_RETRANSMIT_ROUNDS} retransmit rounds")
+            return []
+        self.rounds += 1
+        self.state = "awaiting"
+        self.deadline = time.monotonic() + ACK_TIMEOUT
+        return [end]
+
+    def handle_reply(self, frame_type, payload):
+        if self.state != "awaiting":
+            return  # Stale answer to an earlier END
+        self.silent_rounds = 0
+        self.state = "sending"
+        if frame_type == FRAME_ACK:
+            self.finish(True, f"and acknowledged ({self.transfer.total} chunks, {self.retransmitted} "
+                              f"retransmitted, {self.rate()})")
+        elif frame_type == FRAME_RESEND_HEADER:
+            self.send_header = True
+        elif frame_type == FRAME_NACK:
+            # Payload is a list of (first sequence, count) gap ranges
+            for start, count in struct.iter_unpack("!II", payload):
+                missing = range(start, min(start + count, self.transfer.total))
+                self.retransmit.extend(missing)
+                self.retransmitted += len(missing)
+
+    def handle_timeout(self):
+        self.silent_rounds += 1
+        self.state = "sending"
+        if self.silent_rounds >= ACK_TIMEOUT_RETRIES:
+            self.finish(False, f"({self.rate()}, no acknowledgement, assuming one-way link)")
+
+    def rate(self):
+        return format_rate(self.bytes_sent, self.packets_sent, time.monotonic() - self.transfer.started)
+
+    # " to ip:port" when the file goes to more than one destination
+    def to(self):
+        return f" to {self.destination[0]}:{self.destination[1]}" if len(self.transfer.peers) > 1 else ""
+
+    def finish(self, acknowledged, message):
+        self.state = "done"
+        self.acknowledged = acknowledged
+        if message:
+            print(f"File '{self.transfer.filename}' sent via UDP{self.to()} {message}")
+
+# Function to drive framed transfers over one shared socket, interleaving up to
+# `concurrency` of them; returns whether each one was acknowledged by every destination.
+# `transfers` may be a generator, it is only advanced when a slot frees up.
+def run_transfers(transfers, concurrency=1):
+    waiting = iter(transfers)
+    started = []
+    active = []
+    udp_socket = open_udp_socket()
+    udp_socket.settimeout(ACK_TIMEOUT)
+    try:
+        while waiting or active:
+            while waiting and len(active) < concurrency:
+                transfer = next(waiting, None)
+                if transfer is None:
+                    waiting = None
+                    break
+                started.append(transfer)
+                active.append(transfer)
+            if not active:
+                continue
+
+            # One batch per transfer and destination per round, so every transfer makes progress
+            for transfer in active:
+                sending = [peer for peer in transfer.peers if peer.state == "sending"]
+                if not sending:
+                    continue
+                shared = transfer.first_pass_datagrams(SEND_BATCH_SIZE) if transfer.first_pass else []
+                for peer in sending:
+                    batch = peer.next_datagrams(shared, SEND_BATCH_SIZE) or peer.end_datagrams()
+                    if batch:
+                        peer.pacer.send_batch(udp_socket, batch, peer.destination)
+                        peer.bytes_sent += sum(len(d) for d in batch)
+                        peer.packets_sent += len(batch)
+
+            # Collect ACK/NACKs; block only when every destination is waiting for one
+            peers = [peer for transfer in active for peer in transfer.peers]
+            by_id = {t.file_id: t for t in active if any(peer.state == "awaiting" for peer in t.peers)}
+            if any(peer.state == "sending" for peer in peers) or not by_id:
+                timeout = 0
+            else:
+                timeout = max(0.0, min(peer.deadline for peer in peers if peer.state == "awaiting")
+                              - time.monotonic())
+            while select.select([udp_socket], [], [], timeout)[0]:
+                timeout = 0
+                try:
+                    data, addr = udp_socket.recvfrom(65535)
+                except OSError:
+                    continue  # e.g. ICMP port unreachable surfacing as ECONNREFUSED
+                frame = parse_frame(data)
+                if frame and frame[1] in by_id and frame[0] in (FRAME_ACK, FRAME_NACK, FRAME_RESEND_HEADER):
+                    peer = by_id[frame[1]].peer_for(addr)
+                    if peer is not None:
+                        peer.handle_reply(frame[0], frame[4])
+
+            now = time.monotonic()
+            for peer in peers:
+                if peer.state == "awaiting" and now >= peer.deadline:
+                    peer.handle_timeout()
+            for transfer in active:
+                if transfer.done:
+                    transfer.close()
+            active = [t for t in active if not t.done]
+    finally:
+        udp_socket.close()
+        for transfer in started:
+            transfer.close()
+    return [transfer.acknowledged for transfer in started]
+
+# Function to send a file via UDP using the framed protocol
+def send_file_framed(file_path, receiverIP, receiverPort, kind="file", extra_destinations=()):
+    destinations = [(receiverIP, receiverPort), *extra_destinations]
+    return run_transfers([FramedTransfer(file_path, destinations, kind)])[0]
+
+# Function to send several files at once over one socket, interleaved under the global rate cap.
+# files are (file path, SHA-256) pairs and may come from a generator (e.g. in the order their
+# hashes complete); manifest_id is the transfer id of the manifest sent ahead of them, if any.
+def send_files_concurrently(files, receiverIP, receiverPort, extra_destinations=(), manifest_id=None):
+    destinations = [(receiverIP, receiverPort), *extra_destinations]
+    transfers = []
+
+    def admitted():
+        for path, file_hash in files:
+            transfers.append(FramedTransfer(path, destinations, manifest_id=manifest_id, file_hash=file_hash))
+            yield transfers[-1]
+
+    run_transfers(admitted(), CONCURRENT_TRANSFERS)
+    # A file is delivered once every receiver that can answer has acknowledged it
+    return {transfer.file_path: all(peer.acknowledged or peer.one_way for peer in transfer.peers)
+            for transfer in transfers}
+
 # Function to generate a hash for a file
 def generate_file_hash(file_path):
     hash_obj = hashlib.sha256()
-    with open(file_path, 'rb') as file:
+    buffer = bytearray(HASH_READ_SIZE)
+    view = memoryview(buffer)
+    with open(file_path, 'rb', buffering=0) as file:
         while True:
-            chunk = file.read(4096)
-            if not chunk:
+            size = file.readinto(buffer)
+            if not size:
                 break
-            hash_obj.update(chunk)
+            hash_obj.update(view[:size])
     return hash_obj.hexdigest()
 
-# Function to create the hash log for all JSON files
-def create_hash_log(directory, log_file_path):
-    file_hashes = []
-    for filename in os.listdir(directory):
-        if filename.endswith('.json'):
-            file_path = os.path.join(directory, filename)
-            file_hash = generate_file_hash(file_path)
-            file_hashes.append({"filename": filename, "hash": file_hash})
-            print(f"Generated hash for '{filename}': {file_hash}")
-
-    # Write the hashes to the log file
+# Function to hash files in parallel, yielding (file_path, hash) as each digest is ready
+def hash_files(file_paths):
+    file_paths = list(file_paths)
+    workers = min(HASH_WORKERS or os.cpu_count() or 1, len(file_paths))
+    if workers <= 1:
+        for file_path in file_paths:
+            yield file_path, generate_file_hash(file_path)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(generate_file_hash, file_path): file_path for file_path in file_paths}
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.result()
+
+# Function to hash files and record the result, yielding (file path, hash) once each is known
+def hash_files_into(file_paths, file_hashes):
+    for file_path, file_hash in hash_files(file_paths):
+        filename = os.path.basename(file_path)
+        file_hashes.append({"filename": filename, "hash": file_hash})
+        print(f"Generated hash for '{filename}': {file_hash}")
+        yield file_path, file_hash
+
+# Function to write the hash log
+def write_hash_log(file_hashes, log_file_path):
     with open(log_file_path, 'w') as log_file:
         json.dump(file_hashes, log_file, indent=4)
 
     print(f"Hash log saved to '{log_file_path}'")
 
+# Function to create the hash log for all JSON files
+def create_hash_log(directory, log_file_path):
+    file_paths = [os.path.join(directory, filename)
+                  for filename in os.listdir(directory) if filename.endswith('.json')]
+    file_hashes = []
+    for _ in hash_files_into(file_paths, file_hashes):
+        pass
+    write_hash_log(file_hashes, log_file_path)
+
+# Function to send the manifest for a batch: the hash log entries plus each file's size. Both
+# describe the original file, which is what the receiver ends up with even when COMPRESSION is
+# on; chunk counts are left to each transfer's header, as they depend on the compressed size.
+# Returns the manifest's transfer id, which every file header of the batch then names.
+def send_manifest(file_hashes, receiverIP, receiverPort, extra_destinations=()):
+    destinations = [(receiverIP, receiverPort), *extra_destinations]
+    manifest = []
+    for entry in file_hashes:
+        size = os.path.getsize(os.path.join(directoryToWatch, entry["filename"]))
+        manifest.append({**entry, "size": size})
+    with open(manifestFile, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=4)
+    print(f"Manifest saved to '{manifestFile}' ({len(manifest)} files)")
+    transfer = FramedTransfer(manifestFile, destinations, kind="manifest")
+    run_transfers([transfer])
+    return transfer.file_id
+
 # Function to send the hash log via UDP
-def send_hash_log(log_file_path, receiverIP, receiverPort):
-    chunk_size = 1024
-    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+def send_hash_log(log_file_path, receiverIP, receiverPort, extra_destinations=()):
+    destinations = [(receiverIP, receiverPort), *extra_destinations]
+    chunk_size = min(chunk_size_for(destination) for destination in destinations)
+    udp_socket = open_udp_socket()
 
     # Send a start message to indicate the start of the hash log
-    udp_socket.sendto(b"HASH_LOG_START", (receiverIP, receiverPort))
-    time.sleep(0.01)  # Sleep
+    for destination in destinations:
+        pacer_for(destination).sendto(udp_socket, b"HASH_LOG_START", destination)
 
     # Read the hash log and send it in chunks via UDP
     with open(log_file_path, 'r') as log_file:
         log_data = log_file.read().encode()  # Convert the log data to bytes
 
-        # Split the log data into chunks and send each chunk
-        for i in range(0, len(log_data), chunk_size):
-            udp_socket.sendto(log_data[i:i + chunk_size], (receiverIP, receiverPort))
-            time.sleep(0.001)
+        # Split the log data into chunks and send them in batches
+        chunks = [log_data[i:i + chunk_size] for i in range(0, len(log_data), chunk_size)]
+        for i in range(0, len(chunks), SEND_BATCH_SIZE):
+            for destination in destinations:
+                pacer_for(destination).send_batch(udp_socket, chunks[i:i + SEND_BATCH_SIZE], destination)
 
     # Send EOF signal after the entire log file has been sent
-    udp_socket.sendto(b"EOF", (receiverIP, receiverPort))
+    for destination in destinations:
+        pacer_for(destination).sendto(udp_socket, b"EOF", destination)
     print("Hash log sent via UDP")
 
     udp_socket.close()
 
 # Function to delete JSON files after processing
-def delete_json_files(directory):
-    for filename in os.listdir(directory):
-        if filename.endswith('.json'):
-            file_path = os.path.join(directory, filename)
-            os.remove(file_path)
-            print(f"Deleted file: {file_path}")
+def delete_json_files(directory, filenames=None):
+    if filenames is None:
+        filenames = [f for f in os.listdir(directory) if f.endswith('.json')]
+    for filename in filenames:
+        file_path = os.path.join(directory, filename)
+        os.remove(file_path)
+        print(f"Deleted file: {file_path}")
 
 # Function to process all files and hashes
 def process_all_files_and_hashes():
     json_files = [f for f in os.listdir(directoryToWatch) if f.endswith('.json')]
 
     if json_files:
-        # Step 1: Create the hash log
-        create_hash_log(directoryToWatch, hashlogFile)
-
-        # Step 2: Send all JSON files via UDP
-        for filename in json_files:
-            file_path = os.path.join(directoryToWatch, filename)
-            send_file(file_path, receiverIP, receiverPort)
-
-        # Step 3: Send "ALL_FILES_SENT" signal
-        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        udp_socket.sendto(b"ALL_FILES_SENT", (receiverIP, receiverPort))
-        print("Sent ALL_FILES_SENT signal")
-        udp_socket.close()
-
-        time.sleep(0.1)  # Short delay before sending the hash log
+        process_files([os.path.join(directoryToWatch, filename) for filename in json_files],
+                      manifest_first=MANIFEST_FIRST)
+    else:
+        print("No JSON files to process.")
 
-        # Step 4: Send the hash log
-        send_hash_log(hashlogFile, receiverIP, receiverPort)
+# Function to send one batch of files with its manifest or hash log, then delete them. Only the
+# files of this batch are deleted, never ones that landed in the directory meanwhile. With
+# keep_unacknowledged, files a receiver never acknowledged are kept; their paths are returned.
+def process_files(file_paths, manifest_first=False, keep_unacknowledged=False):
+    file_hashes = []
+    manifest_id = None
+    manifest_first = manifest_first and FRAMED_PROTOCOL
+    if manifest_first:
+        # Step 1: Hash the whole batch and send the manifest ahead of the files
+        hashed = list(hash_files_into(file_paths, file_hashes))
+        manifest_id = send_manifest(file_hashes, receiverIP, receiverPort, EXTRA_RECEIVERS)
+    else:
+        # Step 1: Hash the files in parallel; each file is sent as soon as its hash is ready
+        hashed = hash_files_into(file_paths, file_hashes)
 
-        # Step 5: Delete the JSON files
-        delete_json_files(directoryToWatch)
+    # Step 2: Send all JSON files via UDP
+    if FRAMED_PROTOCOL:
+        delivered = send_files_concurrently(hashed, receiverIP, receiverPort, EXTRA_RECEIVERS, manifest_id)
     else:
-        print("No JSON files to process.")
+        delivered = {}
+        for file_path, _ in hashed:
+            send_file(file_path, receiverIP, receiverPort, EXTRA_RECEIVERS)
+            delivered[file_path] = True
+
+    # The hash log can only be written once every file has been hashed
+    write_hash_log(file_hashes, hashlogFile)
+
+    # Step 3: Send "ALL_FILES_SENT" signal
+    udp_socket = open_udp_socket()
+    for destination in [(receiverIP, receiverPort), *EXTRA_RECEIVERS]:
+        pacer_for(destination).sendto(udp_socket, b"ALL_FILES_SENT", destination)
+    print("Sent ALL_FILES_SENT signal")
+    udp_socket.close()
+
+    time.sleep(0.1)  # Short delay before sending the hash log
+
+    # Step 4: Send the hash log (unless the manifest already carried the hashes)
+    if not manifest_first:
+        if FRAMED_PROTOCOL:
+            send_file_framed(hashlogFile, receiverIP, receiverPort, kind="hash_log",
+                             extra_destinations=EXTRA_RECEIVERS)
+        else:
+            send_hash_log(hashlogFile, receiverIP, receiverPort, EXTRA_RECEIVERS)
+
+    # Step 5: Delete the JSON files
+    kept = [path for path, ok in delivered.items() if keep_unacknowledged and not ok]
+    delete_json_files(directoryToWatch,
+                      [os.path.basename(path) for path in delivered if path not in kept])
+    return kept
+
+# Watch mode: tracks the JSON files in a directory and reports the ones that are fully written
+class ReadyFileWatcher(FileSystemEventHandler):
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = set()  # written and closed, reported by watchdog
+        self.seen = {}  # filename -> ((size, mtime), monotonic time that signature was first seen)
+        self.held = {}  # filename -> monotonic time before which it is not retried
+        self.observer = None
+        if Observer is not None:
+            self.observer = Observer()
+            self.observer.schedule(self, directory, recursive=False)
+            self.observer.start()
+
+    # watchdog callbacks (observer thread): a file closed after writing or renamed into the
+    # directory is complete, so it doesn't have to wait out WATCH_STABLE_SECONDS
+    def on_closed(self, event):
+        self.mark_closed(event.src_path)
+
+    def on_moved(self, event):
+        self.mark_closed(event.dest_path)
+
+    def mark_closed(self, path):
+        if not event_is_json(path, self.directory):
+            return
+        with self.lock:
+            self.closed.add(os.path.basename(path))
+        self.wakeup.set()
+
+    def hold(self, file_paths):
+        until = time.monotonic() + WATCH_RETRY_DELAY
+        for path in file_paths:
+            self.held[os.path.basename(path)] = until
+
+    def wait(self, timeout):
+        self.wakeup.wait(timeout)
+        self.wakeup.clear()
+
+    def ready_files(self):
+        now = time.monotonic()
+        with self.lock:
+            closed, self.closed = self.closed, set()
+        ready = []
+        present = set()
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json') or not entry.is_file():
+                continue
+            present.add(entry.name)
+            if self.held.get(entry.name, 0) > now:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            previous = self.seen.get(entry.name)
+            if previous is None or previous[0] != signature:
+                self.seen[entry.name] = previous = (signature, now)
+            if entry.name in closed or now - previous[1] >= WATCH_STABLE_SECONDS:
+                ready.append((stat.st_mtime_ns, entry.path))
+        for name in set(self.seen) - present:
+            del self.seen[name]
+        for name in set(self.held) - present:
+            del self.held[name]
+        # Oldest first, so a burst of new reports can't starve earlier ones
+        return [path for _, path in sorted(ready)[:WATCH_BATCH_SIZE]]
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+
+# Function to check that a watchdog event path is a JSON file directly inside the directory
+def event_is_json(path, directory):
+    if isinstance(path, bytes):
+        path = os.fsdecode(path)
+    return path.endswith('.json') and os.path.dirname(os.path.abspath(path)) == os.path.abspath(directory)
+
+# Function to send JSON files continuously as they land in the directory
+def watch_directory(directory):
+    watcher = ReadyFileWatcher(directory)
+    detection = "close-write events" if watcher.observer is not None else "size stability"
+    print(f"Process {os.getpid()} watching {directory} for JSON files ({detection})...")
+    try:
+        while True:
+            ready = watcher.ready_files()
+            if not ready:
+                watcher.wait(WATCH_POLL_INTERVAL)
+                continue
+            print(f"Sending batch of {len(ready)} file(s)")
+            kept = process_files(ready, manifest_first=True, keep_unacknowledged=True)
+            if kept:
+                print(f"{len(kept)} file(s) not acknowledged, retrying in {WATCH_RETRY_DELAY}s")
+                watcher.hold(kept)
+    finally:
+        watcher.stop()
 
 if __name__ == "__main__":
+    if WATCH_MODE:
+        watch_directory(directoryToWatch)
     print(f"Process {os.getpid()} waiting for signal to start...")
     while True:
         if JSONAccess:
@@ -0,0 +1,441 @@
+"""
+UDP Transfer Soak Benchmark
+
+Runs udp_send_json.py and udp_recv_json_V0.5.py end to end on loopback, with a local proxy
+between them that injects loss, reordering and duplication, and reports per scenario:
+
+- delivery: files that arrived with the right SHA-256, corrupted and missing files
+- goodput: bytes delivered intact per second, from the first datagram to the last file written
+- loss recovery: datagrams the proxy dropped, chunks the sender retransmitted, chunks the
+  receiver rebuilt from FEC parity, duplicates and NACKed gaps the receiver saw
+- memory high-water mark (max RSS) of the sender and the receiver process
+
+The corpus is synthetic: JSON reports (compressible records) and PCAP captures (random
+payloads), in sizes set below. Each scenario sends the corpus ROUNDS times with fresh names,
+so a large ROUNDS turns the benchmark into a soak test and a growing receiver high-water mark
+shows up as a leak.
+
+The sender and receiver each run in their own process, loaded straight from the scripts like
+udp_batch_benchmark.py does, with the settings below applied on top of the script defaults.
+Everything runs in a temporary directory. The table lists resent chunks, FEC-rebuilt chunks and
+receiver-side duplicates, with the peak RSS of each process in MB; the full results, including
+the receiver's metrics snapshot, are saved to udp_soak_results.json in the current directory.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import select
+import shutil
+import socket
+import struct
+import hashlib
+import resource
+import tempfile
+import threading
+import subprocess
+import importlib.util
+
+# Scripts under test
+SENDER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "udp_send_json.py")
+RECEIVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "udp_recv_json_V0.5.py")
+
+# Synthetic corpus
+JSON_FILES = 40
+JSON_FILE_SIZE = 256 * 1024
+PCAP_FILES = 4
+PCAP_FILE_SIZE = 4 * 1024 * 1024
+CORPUS_SEED = 1
+
+# Times each scenario sends the whole corpus (raise it for a soak test)
+ROUNDS = 1
+
+# Settings applied to every run; each scenario can override them
+SENDER_SETTINGS = {
+    "FRAMED_PROTOCOL": True,
+    "SEND_RATE_BYTES_PER_SEC": 50 * 1000 * 1000,
+    "HASH_WORKERS": 2,
+}
+RECEIVER_SETTINGS = {
+    "receiver_backend": "threaded",
+    "metrics_address": None,
+    "nas_pcap_dir": None,
+}
+
+# name, impairments (probability per datagram) and setting overrides of each scenario
+SCENARIOS = [
+    {"name": "clean"},
+    {"name": "loss 1%", "loss": 0.01},
+    {"name": "loss 1% reorder dup", "loss": 0.01, "reorder": 0.05, "duplicate": 0.01},
+    {"name": "loss 1% fec 2/16", "loss": 0.01, "sender": {"FEC_PARITY_CHUNKS": 2}},
+    {"name": "one-way loss 1% fec 4/16", "loss": 0.01,
+     "sender": {"WAIT_FOR_ACK": False, "FEC_PARITY_CHUNKS": 4}},
+    {"name": "legacy clean", "sender": {"FRAMED_PROTOCOL": False}},
+]
+
+# Later datagrams a reordered datagram is held back for
+REORDER_DEPTH = 8
+# Datagrams the proxy reads from one socket before checking the other
+PROXY_DRAIN = 256
+# How long to wait for further files once the sender has finished
+SETTLE_SECONDS = 5.0
+KEEP_WORK_DIR = False
+
+PCAP_GLOBAL_HEADER = struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)
+PCAP_RECORD_HEADER = struct.Struct("<IIII")
+
+# Function to load one of the scripts as a module (registered, so the hash pool can pickle it)
+def load_script(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# Function to read this process's peak resident set size in MB. On Linux ru_maxrss carries over
+# the parent's peak through fork and exec, so VmHWM (this process image only) is used instead.
+def max_rss_mb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+# Function to write a synthetic JSON report of roughly the given size
+def write_json_report(path, size, rng):
+    records = []
+    length = 2
+    while length < size:
+        record = {
+            "timestamp": 1700000000 + rng.randrange(86400 * 30),
+            "src_ip": f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}",
+            "dst_port": rng.choice([22, 53, 80, 443, 3389, 8080]),
+            "signature": rng.choice(["ET SCAN", "ET POLICY", "GPL ICMP", "ET MALWARE"]),
+            "bytes": rng.randrange(40, 1500),
+            "payload": rng.randbytes(24).hex(),
+        }
+        records.append(record)
+        length += len(json.dumps(record)) + 2
+    with open(path, "w") as file:
+        json.dump(records, file)
+
+# Function to write a synthetic PCAP capture of roughly the given size
+def write_pcap(path, size, rng):
+    with open(path, "wb") as file:
+        file.write(PCAP_GLOBAL_HEADER)
+        written = len(PCAP_GLOBAL_HEADER)
+        while written < size:
+            packet = rng.randbytes(rng.randrange(60, 1514))
+            file.write(PCAP_RECORD_HEADER.pack(1700000000 + written // 1000, written % 1000000,
+                                               len(packet), len(packet)))
+            file.write(packet)
+            written += PCAP_RECORD_HEADER.size + len(packet)
+
+# Function to create the corpus and return {filename: (size, sha256)}
+def make_corpus(directory):
+    rng = random.Random(CORPUS_SEED)
+    os.makedirs(directory, exist_ok=True)
+    for i in range(JSON_FILES):
+        write_json_report(os.path.join(directory, f"report_{i:04d}.json"), JSON_FILE_SIZE, rng)
+    for i in range(PCAP_FILES):
+        write_pcap(os.path.join(directory, f"capture_{i:04d}.pcap"), PCAP_FILE_SIZE, rng)
+    corpus = {}
+    for filename in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, filename), "rb") as file:
+            data = file.read()
+        corpus[filename] = (len(data), hashlib.sha256(data).hexdigest())
+    return corpus
+
+# Local UDP proxy between sender and receiver that drops, reorders and duplicates datagrams
+class ImpairmentProxy:
+    def __init__(self, target, frame_header, frame_magic, frame_data, loss=0.0, reorder=0.0, duplicate=0.0):
+        self.front = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # sender side
+        self.front.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        self.front.bind(("127.0.0.1", 0))
+        self.back = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # receiver side
+        self.back.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        self.back.bind(("127.0.0.1", 0))
+        self.back.connect(target)
+        self.front.setblocking(False)
+        self.back.setblocking(False)
+        self.address = self.front.getsockname()
+        self.frame_header = frame_header
+        self.frame_magic = frame_magic
+        self.frame_data = frame_data
+        self.loss = loss
+        self.reorder = reorder
+        self.duplicate = duplicate
+        self.rng = random.Random(CORPUS_SEED)
+        self.sender = None
+        self.held = []  # [datagrams still to pass, data, send]
+        self.seen_chunks = set()
+        self.stats = {"forwarded": 0, "replies": 0, "dropped": 0, "reordered": 0, "duplicated": 0,
+                      "retransmitted": 0}
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        self.front.close()
+        self.back.close()
+
+    def to_receiver(self, data):
+        self.back.send(data)
+
+    def to_sender(self, data):
+        self.front.sendto(data, self.sender)
+
+    def count_retransmit(self, data):
+        if len(data) < self.frame_header.size:
+            return
+        magic, frame_type, file_id, seq, _ = self.frame_header.unpack_from(data)
+        if magic == self.frame_magic and frame_type == self.frame_data:
+            if (file_id, seq) in self.seen_chunks:
+                self.stats["retransmitted"] += 1
+            self.seen_chunks.add((file_id, seq))
+
+    def impair(self, data, send):
+        if self.rng.random() < self.loss:
+            self.stats["dropped"] += 1
+        else:
+            copies = 2 if self.rng.random() < self.duplicate else 1
+            self.stats["duplicated"] += copies - 1
+            if self.rng.random() < self.reorder:
+                self.stats["reordered"] += 1
+                self.held.extend([REORDER_DEPTH, data, send] for _ in range(copies))
+                return
+            for _ in range(copies):
+                send(data)
+        self.release(1)
+
+    def release(self, passed):
+        still_held = []
+        for entry in self.held:
+            entry[0] -= passed
+            if entry[0] <= 0:
+                entry[2](entry[1])
+            else:
+                still_held.append(entry)
+        self.held = still_held
+
+    def run(self):
+        while not self.stopping.is_set():
+            readable, _, _ = select.select([self.front, self.back], [], [], 0.05)
+            if not readable:
+                self.release(REORDER_DEPTH)  # link went quiet: deliver what was held back
+                continue
+            # Drain each socket, so the proxy keeps up with batched senders instead of
+            # overflowing its own receive buffer
+            for _ in range(PROXY_DRAIN if self.front in readable else 0):
+                try:
+                    data, self.sender = self.front.recvfrom(65535)
+                except BlockingIOError:
+                    break
+                self.stats["forwarded"] += 1
+                self.count_retransmit(data)
+                self.impair(data, self.to_receiver)
+            for _ in range(PROXY_DRAIN if self.back in readable and self.sender is not None else 0):
+                try:
+                    data = self.back.recv(65535)
+                except (BlockingIOError, ConnectionRefusedError):
+                    break
+                self.stats["replies"] += 1
+                self.impair(data, self.to_sender)
+
+# Sender process: sends the corpus ROUNDS times to the proxy, then writes its result file
+def run_sender(work_dir, corpus_dir, proxy_port, settings):
+    os.chdir(work_dir)
+    sender = load_script("udp_send_json", SENDER_SCRIPT)
+    for name, value in settings.items():
+        setattr(sender, name, value)
+    sender.pacer = sender.Pacer(sender.SEND_RATE_BYTES_PER_SEC, sender.SEND_RATE_PACKETS_PER_SEC,
+                                sender.PACER_BURST_BYTES, sender.PACER_BURST_PACKETS)
+    sender.destination_pacers.clear()
+    sender.receiverIP, sender.receiverPort = "127.0.0.1", proxy_port
+    sender.directoryToWatch = "REPORTS"
+    os.makedirs("REPORTS", exist_ok=True)
+    os.makedirs("HASH", exist_ok=True)
+
+    started = time.time()
+    for round_number in range(ROUNDS):
+        file_paths = []
+        for filename in sorted(os.listdir(corpus_dir)):
+            path = os.path.join("REPORTS", f"r{round_number:04d}_{filename}")
+            shutil.copyfile(os.path.join(corpus_dir, filename), path)
+            file_paths.append(path)
+        sender.process_files(file_paths, manifest_first=sender.MANIFEST_FIRST)
+    result = {"started": started, "elapsed": time.time() - started, "datagrams": sender.pacer.packets_sent,
+              "max_rss_mb": max_rss_mb()}
+    with open("result.json", "w") as file:
+        json.dump(result, file)
+
+# Receiver process: receives until stdin is closed, then writes its result file
+def run_receiver(work_dir, port, settings):
+    os.chdir(work_dir)
+    receiver = load_script("udp_recv_json", RECEIVER_SCRIPT)
+    for name, value in settings.items():
+        setattr(receiver, name, value)
+    receiver.listen_ip, receiver.listen_port = "127.0.0.1", port
+    receiver.listen_addresses = [(receiver.listen_ip, receiver.listen_port)]
+    if receiver.receiver_backend == "asyncio":
+        target = receiver.receive_files_async
+    else:
+        target = receiver.receive_files_and_hash_logs
+    threading.Thread(target=target, daemon=True).start()
+    time.sleep(0.5)
+    open("ready", "w").close()
+
+    sys.stdin.read()
+    result = {"metrics": receiver.metrics_snapshot(), "max_rss_mb": max_rss_mb()}
+    with open("result.json", "w") as file:
+        json.dump(result, file)
+    os._exit(0)
+
+# Function to pick a free loopback UDP port
+def free_port():
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+# Function to start this script again in one of its process roles, logging to the work dir
+def spawn(role, work_dir, *args):
+    log = open(os.path.join(work_dir, f"{role}.log"), "w")
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), role, work_dir, *map(str, args)],
+                            stdin=subprocess.PIPE, stdout=log, stderr=subprocess.STDOUT)
+
+# Function to wait until every expected file arrived, or nothing new arrived for SETTLE_SECONDS
+def wait_for_files(directory, expected):
+    arrived = 0
+    last_change = time.monotonic()
+    while time.monotonic() - last_change < SETTLE_SECONDS:
+        present = len(expected.intersection(os.listdir(directory)))
+        if present == len(expected):
+            return
+        if present != arrived:
+            arrived, last_change = present, time.monotonic()
+        time.sleep(0.05)
+
+# Function to check what arrived against the corpus
+def check_delivery(received_dir, corrupted_dir, corpus):
+    delivery = {"files": 0, "intact": 0, "corrupted": 0, "missing": 0, "bytes": 0, "last_write": 0.0}
+    for round_number in range(ROUNDS):
+        for filename, (size, digest) in corpus.items():
+            name = f"r{round_number:04d}_{filename}"
+            path = os.path.join(received_dir, name)
+            delivery["files"] += 1
+            if not os.path.exists(path):
+                delivery["corrupted" if os.path.exists(os.path.join(corrupted_dir, name)) else "missing"] += 1
+                continue
+            with open(path, "rb") as file:
+                data = file.read()
+            if hashlib.sha256(data).hexdigest() == digest:
+                delivery["intact"] += 1
+                delivery["bytes"] += size
+                delivery["last_write"] = max(delivery["last_write"], os.path.getmtime(path))
+            else:
+                delivery["corrupted"] += 1
+    return delivery
+
+# Function to run one scenario and return its results
+def run_scenario(scenario, work_dir, corpus_dir, corpus, frame_constants):
+    os.makedirs(work_dir)
+    sender_dir = os.path.join(work_dir, "sender")
+    receiver_dir = os.path.join(work_dir, "receiver")
+    os.makedirs(sender_dir)
+    os.makedirs(receiver_dir)
+    sender_settings = {**SENDER_SETTINGS, **scenario.get("sender", {})}
+    receiver_settings = {**RECEIVER_SETTINGS, **scenario.get("receiver", {})}
+
+    port = free_port()
+    receiver = spawn("receiver", receiver_dir, port, json.dumps(receiver_settings))
+    while not os.path.exists(os.path.join(receiver_dir, "ready")):
+        if receiver.poll() is not None:
+            raise RuntimeError(f"receiver exited, see {receiver_dir}/receiver.log")
+        time.sleep(0.05)
+    proxy = ImpairmentProxy(("127.0.0.1", port), *frame_constants, loss=scenario.get("loss", 0.0),
+                            reorder=scenario.get("reorder", 0.0), duplicate=scenario.get("duplicate", 0.0))
+    proxy.start()
+
+    sender = spawn("sender", sender_dir, corpus_dir, proxy.address[1], json.dumps(sender_settings))
+    sender.wait()
+    expected = {f"r{round_number:04d}_{filename}" for round_number in range(ROUNDS) for filename in corpus}
+    wait_for_files(os.path.join(receiver_dir, "received"), expected)
+    receiver.communicate()
+    proxy.stop()
+
+    with open(os.path.join(sender_dir, "result.json")) as file:
+        sent = json.load(file)
+    with open(os.path.join(receiver_dir, "result.json")) as file:
+        received = json.load(file)
+    delivery = check_delivery(os.path.join(receiver_dir, "received"), os.path.join(receiver_dir, "corrupted"), corpus)
+    sites = received["metrics"]["sites"].values()
+    elapsed = delivery["last_write"] - sent["started"] if delivery["intact"] else 0.0
+    return {
+        "scenario": scenario["name"],
+        "delivery": delivery,
+        "goodput_mb_per_sec": delivery["bytes"] / elapsed / 1e6 if elapsed > 0 else 0.0,
+        "send_seconds": sent["elapsed"],
+        "proxy": proxy.stats,
+        # Sent but never read by the proxy (its socket buffer overflowed): not an injected loss
+        "lost_before_proxy": sent["datagrams"] - proxy.stats["forwarded"],
+        "fec_recovered": sum(site["chunks_recovered"] for site in sites),
+        "receiver_duplicates": sum(site["duplicates"] for site in sites),
+        "receiver_gaps": sum(site["gaps"] for site in sites),
+        "sender_max_rss_mb": sent["max_rss_mb"],
+        "receiver_max_rss_mb": received["max_rss_mb"],
+        "receiver_metrics": received["metrics"],
+    }
+
+def main():
+    work_dir = tempfile.mkdtemp(prefix="udp_soak_bench_")
+    corpus_dir = os.path.join(work_dir, "corpus")
+    corpus = make_corpus(corpus_dir)
+    corpus_bytes = sum(size for size, _ in corpus.values())
+    sender = load_script("udp_send_json", SENDER_SCRIPT)
+    frame_constants = (sender.FRAME_HEADER, sender.FRAME_MAGIC, sender.FRAME_DATA)
+
+    print(f"\nCorpus: {JSON_FILES} JSON reports of ~{JSON_FILE_SIZE // 1024} KB, {PCAP_FILES} PCAPs of "
+          f"~{PCAP_FILE_SIZE // 1024} KB ({corpus_bytes / 1e6:.1f} MB), sent {ROUNDS} time(s) per scenario\n")
+    print(f"{'scenario':<26}{'intact':>10}{'goodput MB/s':>14}{'dropped':>9}{'resent':>8}{'fec':>6}"
+          f"{'dups':>6}{'send RSS':>10}{'recv RSS':>10}")
+    results = []
+    for index, scenario in enumerate(SCENARIOS):
+        result = run_scenario(scenario, os.path.join(work_dir, f"scenario_{index}"), corpus_dir, corpus, frame_constants)
+        results.append(result)
+        delivery = result["delivery"]
+        print(f"{scenario['name']:<26}{delivery['intact']:>5}/{delivery['files']:<4}"
+              f"{result['goodput_mb_per_sec']:>14.2f}{result['proxy']['dropped']:>9}"
+              f"{result['proxy']['retransmitted']:>8}{result['fec_recovered']:>6}{result['receiver_duplicates']:>6}"
+              f"{result['sender_max_rss_mb']:>10.1f}{result['receiver_max_rss_mb']:>10.1f}")
+        if result["lost_before_proxy"] > 0:
+            print(f"  warning: {result['lost_before_proxy']} datagrams overflowed the proxy's socket "
+                  f"buffer; lower SEND_RATE_BYTES_PER_SEC for a clean comparison")
+
+    results_path = os.path.join(work_dir, "results.json")
+    with open(results_path, "w") as file:
+        json.dump(results, file, indent=2)
+    if KEEP_WORK_DIR:
+        print(f"\nResults and logs kept in {work_dir}")
+    else:
+        shutil.copyfile(results_path, "udp_soak_results.json")
+        shutil.rmtree(work_dir)
+        print(f"\nFull results saved to {os.path.abspath('udp_soak_results.json')}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "sender":
+        sys.exit(run_sender(sys.argv[2], sys.argv[3], int(sys.argv[4]), json.loads(sys.argv[5])))
+    if len(sys.argv) > 1 and sys.argv[1] == "receiver":
+        sys.exit(run_receiver(sys.argv[2], int(sys.argv[3]), json.loads(sys.argv[4])))
+    sys.exit(main())
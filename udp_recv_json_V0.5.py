@@ -13,7 +13,7 @@ Key Features:
 1. **Per-Sender Session Management:**
    - When a sender initiates a transfer with a control message (e.g., a packet starting with
      "FILENAME:" for files or "HASH_LOG_START" for hash logs), a new session is created and stored
-     in a session dictionary keyed by the sender's IP.
+     in a session dictionary keyed by the sender's IP and source port (or file id when framed).
    - Each session maintains its own data buffer (a bytearray) where incoming data chunks are appended.
    - When an "EOF" control message is received, the session is finalized—data is written to disk,
      processed, and then the session is removed from memory.
@@ -29,14 +29,77 @@ Key Features:
 
 3. **Data Integrity Verification:**
    - After a hash log session is finalized, the program compares the received SHA-256 hashes with those
-     generated from the corresponding files.
+     computed while each file was being received (kept in an in-memory digest index), so verification
+     does not read the files a second time.
    - Files failing the integrity check are moved to a designated "corrupted" folder.
+   - Senders running in manifest-first mode send a manifest (names, sizes and hashes)
+     before the files, and each file header names the manifest of its batch; each file is then
+     verified the moment it completes and only forwarded to the site folders if it matches.
+     Listed files that never arrive are reported after ALL_FILES_SENT.
 
 4. **Site Name Logging:**
    - A mapping dictionary (`SITE_NAMES`) converts sender IP addresses into user-friendly site names.
    - All terminal logs display only the site names instead of the raw IP addresses for clarity and privacy.
 
-5. **Long-Running Process:**
+5. **Streaming to Disk:**
+   - With stream_to_disk enabled, file sessions write each chunk straight into a temp file under
+     received_dir/.partial (at its offset for framed transfers) and feed SHA-256 as the contiguous
+     prefix grows. On EOF the temp file is atomically renamed into received_dir, so memory per
+     session stays at one byte per chunk regardless of file size.
+
+6. **Framed Protocol with Selective Retransmit:**
+   - Senders running with FRAMED_PROTOCOL prefix every datagram with a binary header (file id,
+     chunk sequence number, total chunk count) and announce each transfer with a JSON FILENAME header.
+   - Framed sessions are keyed by (sender IP, file id) and reassembled by sequence number, so
+     reordered or duplicated datagrams no longer corrupt the file.
+   - On each END frame the receiver replies with an ACK, or a NACK listing the missing chunk ranges
+     so the sender retransmits only those chunks.
+   - The legacy unframed stream is still accepted and detected per datagram.
+   - The sender's chunk size (e.g. ~8.9 KB on jumbo frame links) is advertised in the FILENAME
+     header; the receive buffer (recv_buffer_size) accepts any UDP payload and truncated datagrams
+     are reported.
+   - Files may arrive compressed (zstd or gzip, announced as "encoding" in the FILENAME header);
+     they are decompressed on finalization and verified against the hash of the original content.
+   - Senders may add Reed-Solomon parity datagrams per group of chunks (forward error correction);
+     lost chunks are rebuilt from the parity before any NACK is sent, which is what keeps files
+     intact on one-way diode links where retransmits are impossible.
+
+7. **Batched Datagram Input:**
+   - Datagrams are read in batches: a blocking recvfrom() for the first one, then a non-blocking
+     drain of whatever is already queued. use_recvmmsg reads each batch with one recvmmsg() call
+     into preallocated buffers instead, where libc provides it.
+
+8. **Cheap Fan-Out:**
+   - Copies to the site folders are hard links (or reflinks / in-kernel copies when the folders are
+     on another filesystem) instead of full copies, and NAS copies run on a background thread from
+     a spool directory so slow NAS writes never stall the socket.
+
+9. **Transfer Journal:**
+   - Session starts, chunk ranges written to disk and completions are appended to a journal
+     (fsynced in batches). After a crash or restart, partially streamed framed files are resumed
+     from their temp files, so the sender only has to fill the gaps, and every interrupted
+     transfer is listed with what needs to be resent.
+
+10. **Decoupled Reception and Finalization:**
+   - A dedicated thread drains the socket (with an enlarged SO_RCVBUF) into a bounded queue, packet
+     processing runs on the main thread, and writes, copies and verification run on a worker pool.
+   - Drops (queue full, kernel buffer overflows) and finalization activity are counted and printed
+     every stats_interval seconds.
+   - Per-site counters (datagrams and bytes with their rates, NACKed gaps, duplicates, chunks
+     rebuilt from parity, session durations, integrity results) plus queue depth and finalization
+     latency are served at metrics_address as Prometheus text (/metrics) and JSON (/metrics.json).
+
+11. **Stale Session Eviction:**
+   - Sessions idle for session_idle_timeout (a lost EOF or END) are dropped, and the least recently
+     active sessions are evicted when a site or the receiver exceeds its memory budget, so a flaky
+     link cannot grow memory without bound. Evictions and abandoned sessions are counted.
+
+12. **asyncio Multi-Port Backend:**
+   - With receiver_backend = "asyncio" one event loop serves every address in listen_addresses,
+     draining each socket a batch per wakeup into the same packet thread the threaded backend
+     uses, and sessions keyed by (sender, transfer id) let each site run many transfers in parallel.
+
+13. **Long-Running Process:**
    - The receiver is designed to run continuously (e.g., handling updates every 10 minutes), ensuring
      that completed sessions are cleared from memory to avoid resource overload.
 
@@ -49,7 +112,8 @@ Usage:
 
 Dependencies:
 -------------
-- Python 3.x and its standard library modules: os, socket, hashlib, json, time, shutil.
+- Python 3.x and its standard library modules: os, socket, hashlib, json, time, shutil, struct, ctypes, zlib.
+- Optional: zstandard, to accept zstd-compressed transfers.
 
 Author:
 -------
@@ -66,6 +130,27 @@ import hashlib
 import json
 import time
 import shutil
+import struct
+import ctypes
+import errno
+import functools
+import tempfile
+import threading
+import queue
+import asyncio
+import zlib
+import http.server
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import zstandard
+except ImportError:  # optional, only needed for zstd-compressed transfers
+    zstandard = None
+from collections import OrderedDict
 
 # === Configuration and Directory Setup ===
 received_dir = "./received"
@@ -77,8 +162,34 @@ fm3_dir = "./FM3"
 # Add NAS directory for .pcap files
 nas_pcap_dir = "/mnt/nas"  # Adjust path to your NAS mount point
 
+# Stream incoming files straight to a temp file (hashing as chunks arrive) instead of holding
+# them in memory until EOF. Partial files live under received_dir so the final rename is atomic.
+stream_to_disk = True
+partial_dir = os.path.join(received_dir, ".partial")
+# Reserve the full size of framed files (known from the FILENAME header) when they start.
+preallocate_files = True
+# Chunks (data and parity) buffered in memory for a framed file whose FILENAME header has not
+# arrived yet. Later chunks are dropped until it does; keep this above the sender's HEADER_REPEAT_CHUNKS so a
+# one-way transfer whose header was lost loses nothing before the next copy arrives.
+max_pending_chunks = 1024
+
+# Append-only journal of transfers in progress (session starts, chunk ranges on disk and
+# completions), so a restarted receiver resumes partially streamed framed files and reports
+# which files need a resend. Set to None to disable. Appends are fsynced in batches every
+# journal_sync_interval seconds; chunks received since the last sync are simply NACKed again.
+journal_path = os.path.join(received_dir, ".journal")
+journal_sync_interval = 1.0
+# Rewrite the journal with only the live state once it grows past this size.
+journal_compact_bytes = 64 * 1024 * 1024
+
+# How received files reach the site folders and NAS: "hardlink" (falls back to reflink, then an
+# in-kernel copy when the destination is on another filesystem), "reflink" (independent
+# copy-on-write files) or "copy". NAS copies are spooled and done by a background thread.
+fanout_method = "hardlink"
+nas_spool_dir = os.path.join(received_dir, ".nas_spool")
+
 # Ensure that needed directories exist.
-for directory in (received_dir, corrupted_dir, hashlog_dir, fm1_dir, fm2_dir, fm3_dir):
+for directory in (received_dir, corrupted_dir, hashlog_dir, fm1_dir, fm2_dir, fm3_dir, partial_dir, nas_spool_dir):
     os.makedirs(directory, exist_ok=True)
 
 # Create NAS directory if it doesn't exist (and NAS is mounted)
@@ -92,7 +203,65 @@ except OSError as e:
 # Listening settings
 listen_ip = "0.0.0.0"  # Listen on all interfaces
 listen_port = 50000
-chunk_size = 1024
+# "threaded" serves listen_ip:listen_port with a receive thread; "asyncio" serves every
+# address in listen_addresses (several ports/interfaces) from a single event loop. Either way
+# sessions are assembled on one packet thread.
+receiver_backend = "threaded"
+listen_addresses = [(listen_ip, listen_port)]
+# Multicast groups joined on every listening socket, for senders that list a group in
+# EXTRA_RECEIVERS (udp_send_json.py); listen on 0.0.0.0 (or the group) on the sender's port.
+# Groups are joined on multicast_interface, the address of a local interface; "0.0.0.0" lets the
+# kernel pick one by route.
+multicast_groups = []
+multicast_interface = "0.0.0.0"
+# Largest datagram accepted. Senders pick their chunk size (advertised in the framed FILENAME
+# header); 65535 covers any UDP payload, including ~9 KB chunks on jumbo frame links.
+recv_buffer_size = 65535
+# Datagrams pulled from the kernel per receive call.
+recv_batch_size = 64
+# Read each batch with one recvmmsg() call (Linux/glibc) instead of the recvfrom() drain loop.
+# Opt-in: run UDP_SEND_RECEIVE_JSONS/udp_batch_benchmark.py to see which is faster on this host.
+use_recvmmsg = False
+
+# Kernel receive buffer requested for the socket (SO_RCVBUFFORCE when running as root,
+# otherwise capped by net.core.rmem_max) so bursts from several sites are not dropped.
+socket_rcvbuf = 32 * 1024 * 1024
+# Datagram batches buffered between the receiving thread (or event loop) and the packet thread.
+packet_queue_size = 4096
+# Threads that write, copy and verify completed files off the receive path.
+finalize_workers = 4
+# Seconds between receiver statistics lines (0 disables them).
+stats_interval = 60
+
+# Local HTTP endpoint serving the receiver metrics: /metrics (Prometheus text format) and
+# /metrics.json. None disables it; keep it on loopback unless a scraper elsewhere needs it.
+metrics_address = ("127.0.0.1", 9108)
+# Seconds over which the per-site datagram and byte rates are averaged.
+metrics_rate_window = 10
+
+# Unfinished sessions (e.g. whose EOF/END was lost) are dropped after this many idle seconds.
+session_idle_timeout = 600
+# Bytes unfinished sessions may hold in memory, per site and overall; beyond that the least
+# recently active session is evicted. Files streamed to disk only count their buffered chunks
+# (their FEC parity is kept in a temp file beside them as well).
+max_session_memory_per_site = 512 * 1024 * 1024
+max_session_memory = 2 * 1024 * 1024 * 1024
+# Seconds between idle/memory sweeps of the sessions dict.
+session_sweep_interval = 1.0
+
+# Framed protocol: magic, frame type, file id, chunk sequence number, total chunk count.
+FRAME_MAGIC = b"UDPF"
+FRAME_HEADER = struct.Struct("!4sBIII")
+FRAME_DATA = 1
+FRAME_END = 2
+FRAME_ACK = 3
+FRAME_NACK = 4
+FRAME_RESEND_HEADER = 5
+FRAME_PARITY = 6
+# Gap ranges reported per NACK so it fits a single datagram.
+MAX_NACK_RANGES = 128
+# Completed framed transfers remembered so a lost ACK can be answered again.
+COMPLETED_TRANSFER_MEMORY = 1024
 
 # Known sender IP addresses mapped to site names.
 SITE_NAMES = {
@@ -106,12 +275,58 @@ fm1_ip = "FM1"
 fm2_ip = "FM2"
 fm3_ip = "FM3"
 
-# Dictionary to keep track of active sessions by sender IP.
+# Dictionary to keep track of active sessions by transfer.
+# Legacy transfers are keyed by ("legacy", sender IP, sender port): the sender opens a new
+# socket per file, so the source port tells concurrent transfers from one site apart.
 # Each session is a dict containing:
 #    - type: "file" or "hash_log"
 #    - filename: (if type=="file")
-#    - data: a bytearray() that accumulates incoming chunks.
+#    - data: a bytearray() (or PartialFile) that accumulates incoming chunks.
+#    - memory: bytes of chunk data held in memory, last_active: time.monotonic() of the last
+#      datagram (both used for eviction).
+# Framed transfers are keyed by (sender IP, file id) instead and keep their
+# chunks in a dict (or PartialFile) keyed by sequence number until every gap is filled.
 sessions = {}
+# Recently completed framed transfers, mapped to the manifest id they were sent under (or None)
+completed_transfers = OrderedDict()
+
+# Receiver counters. The datagram counters are written only by the thread reading the sockets
+# (receive thread or event loop) and the session counters only by the packet thread, so those
+# are plain increments; the finalization_* keys are updated by every pool thread under stats_lock.
+counters = {
+    "datagrams_received": 0,
+    "batches_received": 0,
+    "queue_drops": 0,
+    "finalizations_active": 0,
+    "finalizations_completed": 0,
+    "finalization_seconds": 0.0,
+    "sessions_evicted_idle": 0,
+    "sessions_evicted_memory": 0,
+    "sessions_abandoned": 0,
+}
+# Per-site counters keyed by sender IP (see site_counters). Counters are only ever
+# incremented and readers work on a copy. Datagram counters have a single writer (the packet
+# thread) and take no lock on the hot path; integrity counters are bumped by the finalization
+# pool threads through count_integrity, under stats_lock.
+site_metrics = {}
+stats_lock = threading.Lock()
+# Items are (datagrams, replies): a list of (data, addr) and what ACK/NACK frames are sent with.
+packet_queue = queue.Queue(maxsize=packet_queue_size)
+finalize_pool = None
+pending_finalizations = {}
+
+# SHA-256 of each received file, computed while it was received, keyed by filename, with the
+# time it was stored. Entries are consumed when the file is checked against a hash log or
+# manifest; those never checked (e.g. the hash log was lost) expire after session_idle_timeout.
+file_digests = {}
+digests_lock = threading.Lock()
+# Manifest entries (filename, hash, size) announced ahead of a batch of files, as
+# {filename: entry} keyed by (sender IP, manifest transfer id); the files' headers carry that id.
+# Entries are consumed as each file is verified on arrival, the rest reported after ALL_FILES_SENT,
+# or once the batch has been idle for session_idle_timeout if that marker never arrives.
+manifests = {}
+# Time each manifest was received or last had a file verified against it
+manifest_activity = {}
 
 # === Utility Functions ===
 def generate_file_hash(file_path):
@@ -129,14 +344,21 @@ def generate_file_hash(file_path):
         print(f"Error generating hash for file '{file_path}': {e}")
         return None
 
-def verify_files(received_dir, hash_log_path, corrupted_dir):
-    """Verify received files against hashes provided in the hash log."""
-    try:
-        with open(hash_log_path, 'r') as log_file:
-            hash_log = json.load(log_file)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        print(f"Error loading hash log: {e}")
-        return
+def verify_files(received_dir, hash_log_path, corrupted_dir, hash_log=None, sender_ip=None):
+    """
+    Verify received files against hashes provided in the hash log.
+
+    Digests computed while the files were being received (file_digests) are compared directly;
+    files are only re-read when no digest was recorded, e.g. after a receiver restart. Pass the
+    already parsed hash_log to skip reading it back from hash_log_path.
+    """
+    if hash_log is None:
+        try:
+            with open(hash_log_path, 'r') as log_file:
+                hash_log = json.load(log_file)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            print(f"Error loading hash log: {e}")
+            return
 
     for entry in hash_log:
         filename = entry['filename']
@@ -144,23 +366,1332 @@ def verify_files(received_dir, hash_log_path, corrupted_dir):
         file_path = os.path.join(received_dir, filename)
 
         if os.path.exists(file_path):
-            received_hash = generate_file_hash(file_path)
+            received_hash = pop_file_digest(filename) or generate_file_hash(file_path)
             if received_hash == expected_hash:
                 print(f"File '{filename}' passed integrity check.")
+                if sender_ip is not None:
+                    count_integrity(sender_ip, True)
             else:
-                print(f"File '{filename}' failed integrity check. Moving to corrupted folder.")
-                try:
-                    os.rename(file_path, os.path.join(corrupted_dir, filename))
-                except OSError as e:
-                    print(f"Error moving file '{filename}' to corrupted folder: {e}")
+                move_to_corrupted(filename, file_path)
+                if sender_ip is not None:
+                    count_integrity(sender_ip, False)
         else:
             print(f"File '{filename}' not found in received directory.")
 
+def store_file_digest(filename, digest):
+    with digests_lock:
+        file_digests[filename] = (digest, time.monotonic())
+
+def pop_file_digest(filename):
+    """Take the digest recorded for a received file, or None if there is none."""
+    with digests_lock:
+        entry = file_digests.pop(filename, None)
+    return entry[0] if entry else None
+
+def expire_file_digests(now):
+    """Forget digests no hash log or manifest has claimed within session_idle_timeout."""
+    with digests_lock:
+        stale = [filename for filename, (_, stored) in file_digests.items()
+                 if now - stored > session_idle_timeout]
+        for filename in stale:
+            del file_digests[filename]
+    if stale:
+        print(f"Dropped the digests of {len(stale)} file(s) not checked against a hash log or "
+              f"manifest within {session_idle_timeout}s")
+
+def move_to_corrupted(filename, file_path):
+    print(f"File '{filename}' failed integrity check. Moving to corrupted folder.")
+    try:
+        os.rename(file_path, os.path.join(corrupted_dir, filename))
+    except OSError as e:
+        print(f"Error moving file '{filename}' to corrupted folder: {e}")
+
+def take_manifest_entry(sender_ip, manifest_id, filename):
+    """Remove and return a file's entry from its batch's manifest, or None if it is not listed."""
+    key = (sender_ip, manifest_id)
+    entry = manifests.get(key, {}).pop(filename, None)
+    if entry is not None:
+        manifest_activity[key] = time.monotonic()
+        journal_manifest("manifest_file", key, name=filename)
+    return entry
+
+def expire_manifests(now):
+    """
+    Report the missing files of manifests whose ALL_FILES_SENT was lost: those with no file
+    verified and no transfer of their batch active within session_idle_timeout.
+    """
+    active = {(session_sender(key), session.get("manifest")) for key, session in sessions.items()}
+    for key, entries in list(manifests.items()):
+        if key in active or now - manifest_activity.get(key, now) <= session_idle_timeout:
+            continue
+        site_name = SITE_NAMES.get(key[0], "Unknown Site")
+        print(f"Manifest from {site_name} expired after {session_idle_timeout}s without ALL_FILES_SENT")
+        # Digests of listed files that completed but were never matched go with it
+        with digests_lock:
+            for filename in entries:
+                file_digests.pop(filename, None)
+        report_missing_files([(key, entries)], site_name)
+
+def matches_manifest(sender_ip, filename, file_path, manifest_id):
+    """
+    Check a just-completed file against the manifest sent ahead of its batch.
+
+    Files sent without a manifest are left for the hash log. Returns False on a digest mismatch
+    (after moving the file to corrupted_dir) and when the batch's manifest is unknown or does
+    not list the file, which then stays unforwarded in received_dir.
+    """
+    if manifest_id is None:
+        return True
+    entry = take_manifest_entry(sender_ip, manifest_id, filename)
+    if entry is None:
+        print(f"File '{filename}' cannot be verified: its manifest was not received or does not "
+              f"list it. Not forwarding it.")
+        count_integrity(sender_ip, False)
+        return False
+    if pop_file_digest(filename) == entry["hash"]:
+        print(f"File '{filename}' passed integrity check.")
+        count_integrity(sender_ip, True)
+        return True
+    move_to_corrupted(filename, file_path)
+    count_integrity(sender_ip, False)
+    return False
+
+# === Streaming Partial Files ===
+class PartialFile:
+    """
+    A file being received, written straight to a temp file in partial_dir.
+
+    Framed transfers address it like the chunk dict (seq in f, f[seq], f[seq] = data) and
+    chunks are written at seq * chunk_size; legacy transfers use extend() to append. SHA-256 is
+    updated as the contiguous prefix grows, reading back (from the page cache) any chunks that
+    arrived out of order, so only a one-byte-per-chunk bitmap is kept in memory.
+    """
+
+    def __init__(self, filename, chunk_size=None, total=0, size=0, path=None, received=None):
+        if path is None:
+            self.fd, self.path = tempfile.mkstemp(prefix=os.path.basename(filename) + ".", suffix=".part",
+                                                  dir=partial_dir)
+            if hasattr(os, "fchmod"):
+                os.fchmod(self.fd, 0o644)  # mkstemp creates 0600; match files written with open()
+            if preallocate_files and size and hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(self.fd, 0, size)  # reserve the space up front, unfragmented
+                except OSError:
+                    pass  # e.g. not supported by the filesystem; blocks are allocated as chunks land
+        else:
+            # Temp file left by an earlier run, resumed from the journal
+            self.fd, self.path = os.open(path, os.O_RDWR), path
+        self.chunk_size = chunk_size
+        self.total = total
+        self.size = size
+        self.received = received if received is not None else bytearray(total)
+        self.hash = hashlib.sha256()
+        self.hashed = 0  # next sequence number to feed to the hash
+        self.length = 0  # bytes appended in legacy mode
+        self.unjournaled = None  # sequence numbers written since the last journal sync, when journaled
+        self._hash_contiguous()
+
+    def _hash_contiguous(self):
+        while self.hashed < self.total and self.received[self.hashed]:
+            self.hash.update(self[self.hashed])
+            self.hashed += 1
+
+    def _chunk_length(self, seq):
+        return min(self.chunk_size, self.size - seq * self.chunk_size)
+
+    def __contains__(self, seq):
+        return self.received[seq] == 1
+
+    def __getitem__(self, seq):
+        return os.pread(self.fd, self._chunk_length(seq), seq * self.chunk_size)
+
+    def __setitem__(self, seq, data):
+        data = data[:self._chunk_length(seq)]
+        os.pwrite(self.fd, data, seq * self.chunk_size)
+        self.received[seq] = 1
+        if self.unjournaled is not None:
+            self.unjournaled.append(seq)
+        if seq == self.hashed:
+            self.hash.update(data)
+            self.hashed += 1
+            self._hash_contiguous()
+
+    def setdefault(self, seq, data):
+        if not self.received[seq]:
+            self[seq] = data
+
+    def extend(self, data):
+        os.write(self.fd, data)
+        self.hash.update(data)
+        self.length += len(data)
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def discard(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+class ParityFile:
+    """
+    FEC parity of a framed file streamed to a PartialFile, kept in a temp file beside it instead
+    of in memory. Addressed like the parity dict by parity sequence number; parity is never
+    longer than a data chunk, so each one is written at seq * chunk_size.
+    """
+
+    def __init__(self, filename, chunk_size):
+        self.fd, self.path = tempfile.mkstemp(prefix=os.path.basename(filename) + ".", suffix=".parity",
+                                              dir=partial_dir)
+        self.chunk_size = chunk_size
+        self.lengths = {}
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __contains__(self, seq):
+        return seq in self.lengths
+
+    def __getitem__(self, seq):
+        return os.pread(self.fd, self.lengths[seq], seq * self.chunk_size)
+
+    def __setitem__(self, seq, data):
+        os.pwrite(self.fd, data, seq * self.chunk_size)
+        self.lengths[seq] = len(data)
+
+    def __delitem__(self, seq):
+        del self.lengths[seq]
+
+    def discard(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+def discard_session(session):
+    """Release the temp files behind an abandoned session, if any."""
+    for storage in (session.get("data"), session.get("chunks"), session.get("parity")):
+        if isinstance(storage, (PartialFile, ParityFile)):
+            storage.discard()
+    journal_record(session, "drop")
+
+def open_session(key, session):
+    """Register a session, discarding whatever session it replaces."""
+    previous = sessions.get(key)
+    if previous is not None:
+        counters["sessions_abandoned"] += 1
+        discard_session(previous)
+    sessions[key] = session
+
+# === Session Eviction ===
+next_session_sweep = 0.0
+
+def session_sender(key):
+    """Sender IP of a session key, ("legacy", ip, port) or (ip, file id)."""
+    return key[1] if key[0] == "legacy" else key[0]
+
+def evict_session(key, reason):
+    session = sessions.pop(key)
+    site_name = SITE_NAMES.get(session_sender(key), "Unknown Site")
+    name = session.get("filename") or "transfer without header"
+    print(f"Evicting {reason} session '{name}' from {site_name} "
+          f"({session['memory'] // 1024} KB in memory)")
+    counters["sessions_evicted_" + reason] += 1
+    discard_session(session)
+
+def evict_stale_sessions():
+    """
+    Drop sessions, file digests and manifests idle for longer than session_idle_timeout, then
+    evict the least recently active sessions until every site and the receiver as a whole fit
+    their memory budgets.
+    """
+    global next_session_sweep
+    now = time.monotonic()
+    if now < next_session_sweep:
+        return
+    next_session_sweep = now + session_sweep_interval
+
+    for key, session in list(sessions.items()):
+        if now - session["last_active"] > session_idle_timeout:
+            evict_session(key, "idle")
+    expire_file_digests(now)
+    expire_manifests(now)
+
+    site_memory = {}
+    for key, session in sessions.items():
+        sender_ip = session_sender(key)
+        site_memory[sender_ip] = site_memory.get(sender_ip, 0) + session["memory"]
+    for sender_ip, memory in site_memory.items():
+        if memory <= max_session_memory_per_site:
+            continue
+        site_sessions = sorted((session["last_active"], key) for key, session in sessions.items()
+                               if session_sender(key) == sender_ip)
+        for _, key in site_sessions:
+            if memory <= max_session_memory_per_site:
+                break
+            memory -= sessions[key]["memory"]
+            evict_session(key, "memory")
+
+    total = sum(session["memory"] for session in sessions.values())
+    if total > max_session_memory:
+        for _, key in sorted((session["last_active"], key) for key, session in sessions.items()):
+            if total <= max_session_memory:
+                break
+            total -= sessions[key]["memory"]
+            evict_session(key, "memory")
+
+# === Metrics ===
+def site_counters(sender_ip):
+    """Counters for one sender, created on its first datagram."""
+    metrics = site_metrics.get(sender_ip)
+    if metrics is None:
+        metrics = site_metrics.setdefault(sender_ip, {
+            "datagrams": 0, "bytes": 0, "duplicates": 0, "gaps": 0, "chunks_recovered": 0,
+            "sessions_completed": 0, "session_seconds": 0.0, "integrity_passed": 0,
+            "integrity_failures": 0, "datagrams_per_sec": 0.0, "bytes_per_sec": 0.0,
+            "rate_sample": (time.monotonic(), 0, 0),
+        })
+    return metrics
+
+def count_integrity(sender_ip, passed):
+    """Count one integrity check; called from the finalization pool threads."""
+    metrics = site_counters(sender_ip)
+    with stats_lock:
+        metrics["integrity_passed" if passed else "integrity_failures"] += 1
+
+def complete_session(session, sender_ip):
+    """Count a session whose last chunk has arrived and how long it took."""
+    metrics = site_counters(sender_ip)
+    metrics["sessions_completed"] += 1
+    metrics["session_seconds"] += time.monotonic() - session["started"]
+
+next_rate_update = 0.0
+
+def update_rates():
+    """Refresh the per-site datagram and byte rates every metrics_rate_window seconds."""
+    global next_rate_update
+    now = time.monotonic()
+    if now < next_rate_update:
+        return
+    next_rate_update = now + metrics_rate_window
+    for metrics in list(site_metrics.values()):
+        sampled, datagrams, nbytes = metrics["rate_sample"]
+        elapsed = max(now - sampled, 1e-6)
+        metrics["datagrams_per_sec"] = (metrics["datagrams"] - datagrams) / elapsed
+        metrics["bytes_per_sec"] = (metrics["bytes"] - nbytes) / elapsed
+        metrics["rate_sample"] = (now, metrics["datagrams"], metrics["bytes"])
+
+def metrics_snapshot():
+    """Receiver-wide stats plus the per-site counters, keyed by site name."""
+    snapshot = receiver_stats()
+    snapshot["sites"] = {}
+    for sender_ip, metrics in list(site_metrics.items()):
+        site = {name: value for name, value in metrics.items() if name != "rate_sample"}
+        site["sender_ip"] = sender_ip
+        snapshot["sites"][SITE_NAMES.get(sender_ip, sender_ip)] = site
+    return snapshot
+
+# Prometheus metric types; everything else is exported as a gauge
+METRIC_COUNTERS = {
+    "datagrams_received", "batches_received", "queue_drops", "finalizations_completed",
+    "finalization_seconds", "sessions_evicted_idle", "sessions_evicted_memory", "sessions_abandoned",
+    "kernel_rcvbuf_errors",
+    "datagrams", "bytes", "duplicates", "gaps", "chunks_recovered", "sessions_completed",
+    "session_seconds", "integrity_passed", "integrity_failures",
+}
+
+def prometheus_text(snapshot):
+    """Render a metrics snapshot in the Prometheus text exposition format."""
+    lines = []
+    for name, value in snapshot.items():
+        if name == "sites" or value is None:
+            continue
+        metric = f"udp_receiver_{name}"
+        lines.append(f"# TYPE {metric} {'counter' if name in METRIC_COUNTERS else 'gauge'}")
+        lines.append(f"{metric} {value}")
+    per_site = {}
+    for site_name, site in snapshot["sites"].items():
+        label = site_name.replace("\\", "\\\\").replace('"', '\\"')
+        for name, value in site.items():
+            if name != "sender_ip":
+                per_site.setdefault(name, []).append(f'udp_receiver_site_{name}{{site="{label}"}} {value}')
+    for name, samples in per_site.items():
+        lines.append(f"# TYPE udp_receiver_site_{name} {'counter' if name in METRIC_COUNTERS else 'gauge'}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """Serves /metrics (Prometheus) and /metrics.json."""
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = prometheus_text(metrics_snapshot()).encode()
+            content_type = "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body = json.dumps(metrics_snapshot(), indent=2).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would drown the transfer log
+
+def start_metrics_server():
+    """Serve the metrics endpoint from a background thread, if metrics_address is set."""
+    if not metrics_address:
+        return
+    try:
+        server = http.server.ThreadingHTTPServer(metrics_address, MetricsHandler)
+    except OSError as e:
+        print(f"Warning: Could not start metrics endpoint on {metrics_address[0]}:{metrics_address[1]}: {e}")
+        return
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Metrics available at http://{metrics_address[0]}:{metrics_address[1]}/metrics")
+
+# === Transfer Journal ===
+def seq_ranges(seqs):
+    """Collapse sequence numbers into sorted [start, count] ranges."""
+    ranges = []
+    for seq in sorted(set(seqs)):
+        if ranges and ranges[-1][0] + ranges[-1][1] == seq:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([seq, 1])
+    return ranges
+
+class TransferJournal:
+    """
+    Append-only JSON-lines log of transfers in progress.
+
+    Records are {"op": "start" | "chunks" | "done" | "drop", "key": [...], ...} for transfers and
+    "manifest" | "manifest_file" | "manifest_done" for the manifests of batches being verified.
+    They are buffered and written in batches by sync(), which first fsyncs the partial files
+    whose chunk ranges it logs, so the journal never claims data that is not on disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()  # record() is also called from finalization threads
+        self.pending = []
+        self.file = open(path, 'a')
+        self.next_sync = time.monotonic() + journal_sync_interval
+
+    def record(self, entry):
+        with self.lock:
+            self.pending.append(json.dumps(entry))
+
+    def sync(self, force=False):
+        if not force and time.monotonic() < self.next_sync:
+            return
+        self.next_sync = time.monotonic() + journal_sync_interval
+        for session in list(sessions.values()):
+            partial = session.get("chunks")
+            if isinstance(partial, PartialFile) and partial.unjournaled:
+                os.fsync(partial.fd)
+                self.record({"op": "chunks", "key": session["journal_key"],
+                             "ranges": seq_ranges(partial.unjournaled)})
+                partial.unjournaled = []
+        with self.lock:
+            if self.pending:
+                self.file.write("\n".join(self.pending) + "\n")
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.pending = []
+        if self.file.tell() > journal_compact_bytes and not any(
+                not f.done() for futures in pending_finalizations.values() for f in futures):
+            self.compact()
+
+    def compact(self):
+        """Rewrite the journal as the current live state (sessions, manifests and remembered completions)."""
+        lines = [json.dumps({"op": "done", "key": list(key), "manifest": manifest_id})
+                 for key, manifest_id in completed_transfers.items()]
+        for key, entries in list(manifests.items()):
+            lines.append(json.dumps({"op": "manifest", "key": list(key), "entries": list(entries.values())}))
+        for session in sessions.values():
+            start = session.get("journal_start")
+            if start is None:
+                continue
+            lines.append(json.dumps(start))
+            partial = session.get("chunks")
+            if isinstance(partial, PartialFile):
+                os.fsync(partial.fd)
+                received = [seq for seq in range(partial.total) if partial.received[seq]]
+                lines.append(json.dumps({"op": "chunks", "key": start["key"], "ranges": seq_ranges(received)}))
+                partial.unjournaled = []
+        with self.lock:
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w') as temp:
+                temp.write("".join(line + "\n" for line in lines + self.pending))
+                temp.flush()
+                os.fsync(temp.fileno())
+            os.replace(temp_path, self.path)
+            self.file.close()
+            self.file = open(self.path, 'a')
+            self.pending = []
+
+    def close(self):
+        self.sync(force=True)
+        self.file.close()
+
+journal = None
+
+def journal_start(session, key, site_name, **fields):
+    """Journal the start of a session (no-op when journaling is off)."""
+    if journal is None:
+        return
+    start = {"op": "start", "key": list(key), "site": site_name, "type": session["type"],
+             "name": session["filename"], **fields}
+    session["journal_key"] = start["key"]
+    session["journal_start"] = start
+    journal.record(start)
+
+def journal_manifest(op, key, **fields):
+    """Journal a manifest being stored, one of its entries being used up, or it being dropped."""
+    if journal is not None:
+        journal.record({"op": op, "key": list(key), **fields})
+
+def journal_record(session, op, **fields):
+    """Journal a session's completion ("done") or abandonment ("drop")."""
+    if journal is not None and session.get("journal_key") is not None:
+        journal.record({"op": op, "key": session.pop("journal_key"), **fields})
+
+def resume_journal():
+    """
+    Replay the journal left by the previous run.
+
+    Framed files that were being streamed to disk are put back into sessions with the chunks
+    already on disk, so the sender's next END (or its retry of the file, which has the same
+    transfer id) only has to fill in the rest. Manifests still waiting for files are restored
+    too. Every unfinished transfer is listed; those that can't be resumed need a full resend.
+    """
+    global journal
+    if not journal_path:
+        return
+    live = {}
+    live_manifests = {}
+    completed = OrderedDict()
+    try:
+        with open(journal_path) as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn final line from a crash mid-write
+                key = tuple(entry["key"])
+                if entry["op"] == "start":
+                    live[key] = (entry, [])
+                elif entry["op"] == "chunks" and key in live:
+                    live[key][1].extend(entry["ranges"])
+                elif entry["op"] in ("done", "drop"):
+                    live.pop(key, None)
+                    if entry["op"] == "done" and key[0] != "legacy":
+                        completed[key] = entry.get("manifest")
+                elif entry["op"] == "manifest":
+                    live_manifests[key] = {item["filename"]: item for item in entry["entries"]}
+                elif entry["op"] == "manifest_file" and key in live_manifests:
+                    live_manifests[key].pop(entry["name"], None)
+                elif entry["op"] == "manifest_done":
+                    live_manifests.pop(key, None)
+    except FileNotFoundError:
+        pass
+
+    for key in list(completed)[-COMPLETED_TRANSFER_MEMORY:]:
+        completed_transfers[key] = completed[key]
+
+    resumed = {}
+    needs_resend = []
+    for key, (start, ranges) in live.items():
+        path = start.get("path")
+        if path and os.path.exists(path) and key[0] != "legacy":
+            received = bytearray(start["chunks"])
+            for first, count in ranges:
+                count = max(0, min(count, start["chunks"] - first))
+                received[first:first + count] = b"\x01" * count
+            session = new_framed_session(start["chunks"])
+            session.update(type=start["type"], filename=start["name"], size=start["size"],
+                           chunk_size=start["chunk_size"], fec=start.get("fec"),
+                           encoding=start.get("encoding"), original_size=start.get("original_size"),
+                           transfer_id=key[1], manifest=start.get("manifest"),
+                           journal_key=start["key"], journal_start=start)
+            session["chunks"] = PartialFile(start["name"], start["chunk_size"], start["chunks"], start["size"],
+                                            path=path, received=received)
+            session["chunks"].unjournaled = []
+            resumed[key] = session
+            on_disk = sum(received)
+            print(f"Resuming '{start['name']}' from {start['site']}: {on_disk}/{start['chunks']} chunks on disk")
+            if on_disk < start["chunks"]:
+                needs_resend.append(f"{start['site']}: {start['name']} "
+                                    f"(missing {start['chunks'] - on_disk} of {start['chunks']} chunks)")
+        else:
+            if path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            needs_resend.append(f"{start['site']}: {start['name']} (full resend)")
+
+    # Temp files not referenced by a resumed session are leftovers of abandoned transfers (parity
+    # is not journaled, so every parity file is)
+    resumed_paths = {os.path.abspath(session["chunks"].path) for session in resumed.values()}
+    for name in os.listdir(partial_dir):
+        path = os.path.abspath(os.path.join(partial_dir, name))
+        if (name.endswith(".part") and path not in resumed_paths) or name.endswith(".parity"):
+            os.remove(path)
+
+    sessions.update(resumed)
+    manifests.update(live_manifests)
+    manifest_activity.update(dict.fromkeys(live_manifests, time.monotonic()))
+    if live_manifests:
+        print(f"Restored {len(live_manifests)} manifest(s) still waiting for files")
+    journal = TransferJournal(journal_path)
+    journal.compact()
+    if needs_resend:
+        print("Transfers interrupted by the last shutdown (need a resend):")
+        for line in needs_resend:
+            print(f"  {line}")
+
+# === Session Finalization ===
+def save_received_file(sender_ip, site_name, filename, file_data, manifest_id=None):
+    """Write a completed file to disk and copy it to the site and NAS folders."""
+    file_path = os.path.join(received_dir, filename)
+    try:
+        with open(file_path, 'wb') as f:
+            f.write(file_data)
+        store_file_digest(filename, hashlib.sha256(file_data).hexdigest())
+        print(f"File '{filename}' received successfully from {site_name}")
+        if matches_manifest(sender_ip, filename, file_path, manifest_id):
+            distribute_received_file(sender_ip, site_name, filename, file_path)
+    except Exception as e:
+        print(f"Error writing file '{filename}' from {site_name}: {e}")
+
+def commit_partial_file(sender_ip, site_name, filename, partial, manifest_id=None):
+    """Atomically move a fully streamed file into received_dir and copy it onwards."""
+    file_path = os.path.join(received_dir, filename)
+    try:
+        partial.close()
+        os.replace(partial.path, file_path)
+        store_file_digest(filename, partial.hexdigest())
+        print(f"File '{filename}' received successfully from {site_name}")
+        if matches_manifest(sender_ip, filename, file_path, manifest_id):
+            distribute_received_file(sender_ip, site_name, filename, file_path)
+    except Exception as e:
+        print(f"Error writing file '{filename}' from {site_name}: {e}")
+        partial.discard()
+
+def distribute_received_file(sender_ip, site_name, filename, file_path):
+    """Copy a received file to the appropriate site folder and, for PCAPs, the NAS."""
+    try:
+        # Copy the file to the appropriate folder based on sender IP.
+        if sender_ip == fm1_ip:
+            dest = os.path.join(fm1_dir, filename)
+        elif sender_ip == fm2_ip:
+            dest = os.path.join(fm2_dir, filename)
+        elif sender_ip == fm3_ip:
+            dest = os.path.join(fm3_dir, filename)
+        else:
+            dest = None
+
+        if dest:
+            fan_out_file(file_path, dest)
+
+        # Copy .pcap files to NAS if available (in the background, NAS writes can be slow)
+        if filename.lower().endswith('.pcap') and nas_pcap_dir:
+            queue_nas_copy(file_path, os.path.join(nas_pcap_dir, f"{site_name}_{filename}"))
+
+    except Exception as e:
+        print(f"Error copying file '{filename}' from {site_name}: {e}")
+
+# === File Fan-Out ===
+FICLONE = 0x40049409  # Linux ioctl: share the source extents copy-on-write (btrfs, XFS)
+
+def reflink_file(src, dest):
+    """Clone src into dest copy-on-write; raises OSError where the filesystem can't."""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflinks not supported on this platform")
+    with open(src, 'rb') as source, open(dest, 'wb') as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            target.close()
+            os.remove(dest)
+            raise
+
+def zero_copy_file(src, dest):
+    """Copy src to dest in the kernel (copy_file_range, then sendfile), without user-space buffers."""
+    with open(src, 'rb') as source, open(dest, 'wb') as target:
+        remaining = os.fstat(source.fileno()).st_size
+        copy_range = getattr(os, "copy_file_range", None)
+        while remaining > 0:
+            try:
+                if copy_range is not None:
+                    copied = copy_range(source.fileno(), target.fileno(), remaining)
+                else:
+                    copied = os.sendfile(target.fileno(), source.fileno(), None, remaining)
+            except OSError as e:
+                if copy_range is None or e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                                         errno.EOPNOTSUPP):
+                    raise
+                copy_range = None  # e.g. cross-filesystem on older kernels: use sendfile
+                continue
+            if copied == 0:
+                break
+            remaining -= copied
+    shutil.copymode(src, dest)
+
+def fan_out_file(src, dest):
+    """
+    Place the content of src at dest as cheaply as the filesystems allow and return the method used.
+
+    Tries, in order: a hard link (same filesystem, no data written at all), a copy-on-write reflink,
+    and an in-kernel copy. fanout_method can start the chain later, e.g. "reflink" when the
+    destination must be an independent inode, or "copy" for a plain copy.
+    """
+    methods = ("hardlink", "reflink", "copy")
+    start = methods.index(fanout_method) if fanout_method in methods else 0
+    for method in methods[start:]:
+        try:
+            if method == "hardlink":
+                try:
+                    os.link(src, dest)
+                except FileExistsError:
+                    os.remove(dest)
+                    os.link(src, dest)
+            elif method == "reflink":
+                reflink_file(src, dest)
+            else:
+                try:
+                    zero_copy_file(src, dest)
+                except OSError:
+                    shutil.copy(src, dest)
+            return method
+        except OSError:
+            if method == "copy":
+                raise
+    return None
+
+nas_queue = queue.Queue()
+nas_worker = None
+
+def queue_nas_copy(file_path, nas_dest):
+    """
+    Hand a NAS copy to the background worker so the receive loop never waits on the NAS.
+
+    The file is first hard-linked into nas_spool_dir, so the copy still succeeds if the original
+    is later moved to corrupted_dir, and pending copies survive a restart.
+    """
+    spool_path = os.path.join(nas_spool_dir, os.path.basename(nas_dest))
+    try:
+        fan_out_file(file_path, spool_path)
+    except OSError as e:
+        print(f"Warning: Could not spool '{file_path}' for NAS copy: {e}")
+        return
+    nas_queue.put((spool_path, nas_dest))
+    start_nas_worker()
+
+def start_nas_worker():
+    """Start the background NAS copy thread on first use."""
+    global nas_worker
+    if nas_worker is None:
+        nas_worker = threading.Thread(target=nas_copy_worker, name="nas-copy", daemon=True)
+        nas_worker.start()
+
+def nas_copy_worker():
+    """Copy spooled files to the NAS one at a time."""
+    while True:
+        spool_path, nas_dest = nas_queue.get()
+        try:
+            method = fan_out_file(spool_path, nas_dest)
+            print(f"PCAP file copied to NAS ({method}): {nas_dest}")
+        except Exception as nas_error:
+            print(f"Warning: Failed to copy PCAP to NAS: {nas_error}")
+        finally:
+            try:
+                os.remove(spool_path)
+            except OSError:
+                pass
+            nas_queue.task_done()
+
+def resume_nas_copies():
+    """Re-queue NAS copies spooled before the last shutdown."""
+    if not nas_pcap_dir:
+        return
+    for name in os.listdir(nas_spool_dir):
+        nas_queue.put((os.path.join(nas_spool_dir, name), os.path.join(nas_pcap_dir, name)))
+    if not nas_queue.empty():
+        start_nas_worker()
+
+def site_log_path(sender_ip, kind):
+    """Path in hashlog_dir for a hash log or manifest received from the given sender."""
+    timestamp = time.strftime("%Y%m%d_%H%M%S", time.gmtime())
+    # Create a hash log filename based on the sender's site.
+    if sender_ip == fm1_ip:
+        log_filename = f"FM1_received_{kind}_{timestamp}.json"
+    elif sender_ip == fm2_ip:
+        log_filename = f"FM2_received_{kind}_{timestamp}.json"
+    elif sender_ip == fm3_ip:
+        log_filename = f"FM3_received_{kind}_{timestamp}.json"
+    else:
+        log_filename = f"{sender_ip}_received_{kind}_{timestamp}.json"
+    return os.path.join(hashlog_dir, log_filename)
+
+def save_received_hash_log(sender_ip, site_name, hash_log_data):
+    """Write a completed hash log to disk and verify the received files against it."""
+    hash_log_path = site_log_path(sender_ip, "hash_log")
+    try:
+        hash_log_text = hash_log_data.decode('utf-8')
+        with open(hash_log_path, 'w') as log_file:
+            log_file.write(hash_log_text)
+        print(f"Hash log received successfully from {site_name}")
+        verify_files(received_dir, hash_log_path, corrupted_dir, json.loads(hash_log_text), sender_ip)
+    except Exception as e:
+        print(f"Error processing hash log from {site_name}: {e}")
+
+def save_received_manifest(sender_ip, site_name, manifest_id, manifest_data):
+    """Record a manifest sent ahead of a batch so each of its files is verified the moment it completes."""
+    manifest_path = site_log_path(sender_ip, "manifest")
+    try:
+        manifest_text = manifest_data.decode('utf-8')
+        entries = json.loads(manifest_text)
+        with open(manifest_path, 'w') as manifest_file:
+            manifest_file.write(manifest_text)
+    except Exception as e:
+        print(f"Error processing manifest from {site_name}: {e}")
+        return
+    manifests[(sender_ip, manifest_id)] = {entry["filename"]: entry for entry in entries}
+    manifest_activity[(sender_ip, manifest_id)] = time.monotonic()
+    journal_manifest("manifest", (sender_ip, manifest_id), entries=entries)
+    total_bytes = sum(entry.get("size", 0) for entry in entries)
+    print(f"Manifest received from {site_name}: {len(entries)} files, {total_bytes} bytes")
+
+def report_missing_files(batches, site_name):
+    """Forget the given (key, entries) manifests and report the entries whose file never completed."""
+    for key, entries in batches:
+        # Already reported, by expiry or an earlier ALL_FILES_SENT
+        if manifests.pop(key, None) is None:
+            continue
+        manifest_activity.pop(key, None)
+        journal_manifest("manifest_done", key)
+        for filename in list(entries):
+            print(f"File '{filename}' from {site_name} listed in the manifest but not received.")
+
+def submit_manifest_check(sender_ip, site_name):
+    """
+    Report missing manifest files once the sender's queued finalizations are done.
+
+    Only the manifests already received when ALL_FILES_SENT arrived are checked, so the manifest
+    of a next batch that arrives in the meantime is left alone.
+    """
+    batches = [(key, entries) for key, entries in list(manifests.items()) if key[0] == sender_ip]
+    if not batches:
+        return
+    if finalize_pool is None:
+        report_missing_files(batches, site_name)
+        return
+    pending = [f for f in pending_finalizations.get(sender_ip, []) if not f.done()]
+    def check_after_files(earlier=tuple(pending)):
+        futures_wait(earlier)
+        report_missing_files(batches, site_name)
+    finalize_pool.submit(timed_finalization, check_after_files)
+
+def session_payload(session):
+    """Return a completed session's content: bytes, or the PartialFile it was streamed to."""
+    if not session.get("framed"):
+        return session["data"]
+    chunks = session["chunks"]
+    if isinstance(chunks, PartialFile):
+        return chunks
+    return b"".join(chunks[s] for s in range(session["total"]))[:session["size"]]
+
+def decompress_payload(session, payload, site_name):
+    """
+    Restore the original content of a compressed file session.
+
+    Returns bytes, or a new PartialFile (hashed over the original content) when the compressed
+    file was streamed to disk; None if it can't be decoded.
+    """
+    encoding = session["encoding"]
+    original_size = session["original_size"]
+    filename = session["filename"]
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(31)
+    elif encoding == "zstd" and zstandard is not None:
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    else:
+        print(f"Error: '{filename}' from {site_name} uses unsupported encoding '{encoding}'")
+        discard_session(session)
+        return None
+
+    block_size = 1024 * 1024
+    if isinstance(payload, PartialFile):
+        source = payload
+        length = source.size
+        read_block = lambda offset: os.pread(source.fd, block_size, offset)
+        output = PartialFile(filename)
+    else:
+        source = None
+        length = len(payload)
+        read_block = lambda offset: payload[offset:offset + block_size]
+        output = bytearray()
+    written = 0
+    try:
+        for offset in range(0, length, block_size):
+            block = decompressor.decompress(read_block(offset))
+            written += len(block)
+            if original_size is not None and written > original_size:
+                raise ValueError(f"expands beyond the announced {original_size} bytes")
+            output.extend(block)
+        block = decompressor.flush()
+        written += len(block)
+        output.extend(block)
+        if original_size is not None and written != original_size:
+            raise ValueError(f"decompressed to {written} bytes, expected {original_size}")
+    except Exception as e:  # zlib.error, zstandard.ZstdError or the size checks above
+        print(f"Error decompressing '{filename}' from {site_name}: {e}")
+        if source is not None:
+            source.discard()
+            output.discard()
+        return None
+
+    if source is not None:
+        source.discard()
+        return output
+    return bytes(output)
+
+def finalize_session(session, sender_ip, site_name):
+    """Dispatch a completed session to the matching save routine."""
+    payload = session_payload(session)
+    if session["type"] == "file" and session.get("encoding"):
+        payload = decompress_payload(session, payload, site_name)
+        if payload is None:
+            journal_record(session, "drop")
+            return
+    if session["type"] == "file":
+        if isinstance(payload, PartialFile):
+            commit_partial_file(sender_ip, site_name, session["filename"], payload, session.get("manifest"))
+        else:
+            save_received_file(sender_ip, site_name, session["filename"], payload, session.get("manifest"))
+    elif session["type"] == "hash_log":
+        save_received_hash_log(sender_ip, site_name, payload)
+    elif session["type"] == "manifest":
+        save_received_manifest(sender_ip, site_name, session["transfer_id"], payload)
+    else:
+        print(f"Unknown session type from {site_name}")
+        discard_session(session)
+    journal_record(session, "done", manifest=session.get("manifest"))
+
+def submit_finalization(session, sender_ip, site_name):
+    """
+    Finalize a completed session on the worker pool (inline when no pool is running).
+
+    A hash log is only verified after every file finalization already queued for the same
+    sender has finished, so verification never races the files it checks.
+    """
+    if finalize_pool is None or session["type"] == "manifest":
+        # Manifests are applied inline, before any file that follows them can complete
+        finalize_session(session, sender_ip, site_name)
+        return
+
+    pending = [f for f in pending_finalizations.get(sender_ip, []) if not f.done()]
+    if session["type"] == "hash_log":
+        def finalize_after_files(earlier=tuple(pending)):
+            futures_wait(earlier)
+            finalize_session(session, sender_ip, site_name)
+        future = finalize_pool.submit(timed_finalization, finalize_after_files)
+    else:
+        future = finalize_pool.submit(timed_finalization, finalize_session, session, sender_ip, site_name)
+    pending.append(future)
+    pending_finalizations[sender_ip] = pending
+
+def timed_finalization(function, *args):
+    """Run a finalization task, tracking how many are in flight and how long they take."""
+    with stats_lock:
+        counters["finalizations_active"] += 1
+    started = time.monotonic()
+    try:
+        function(*args)
+    except Exception as e:
+        print(f"Error finalizing session: {e}")
+    finally:
+        with stats_lock:
+            counters["finalizations_active"] -= 1
+            counters["finalizations_completed"] += 1
+            counters["finalization_seconds"] += time.monotonic() - started
+
+# === Framed Protocol Helpers ===
+def build_frame(frame_type, file_id, seq, total, payload=b""):
+    """Build a framed datagram."""
+    return FRAME_HEADER.pack(FRAME_MAGIC, frame_type, file_id, seq, total) + payload
+
+def parse_frame(data):
+    """Split a framed datagram into its fields, or return None if it is not a frame."""
+    if len(data) < FRAME_HEADER.size or not data.startswith(FRAME_MAGIC):
+        return None
+    _, frame_type, file_id, seq, total = FRAME_HEADER.unpack_from(data)
+    return frame_type, file_id, seq, total, data[FRAME_HEADER.size:]
+
+def missing_ranges(session):
+    """Return the gaps in a framed session as (first sequence, count) pairs."""
+    ranges = []
+    chunks = session["chunks"]
+    start = None
+    for seq in range(session["total"]):
+        if seq in chunks:
+            if start is not None:
+                ranges.append((start, seq - start))
+                start = None
+        elif start is None:
+            start = seq
+    if start is not None:
+        ranges.append((start, session["total"] - start))
+    return ranges
+
+# === Forward Error Correction ===
+# GF(256) arithmetic (polynomial 0x11d); must match the sender's parity construction.
+GF_EXP = [0] * 512
+GF_LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    GF_EXP[_i] = _x
+    GF_LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= 0x11d
+for _i in range(255, 512):
+    GF_EXP[_i] = GF_EXP[_i - 255]
+
+def gf_mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return GF_EXP[GF_LOG[a] + GF_LOG[b]]
+
+def gf_inv(a):
+    return GF_EXP[255 - GF_LOG[a]]
+
+@functools.lru_cache(maxsize=256)
+def gf_mul_table(constant):
+    """bytes.translate() table multiplying every byte by a constant."""
+    return bytes(gf_mul(constant, x) for x in range(256))
+
+def fec_coefficient(j, i, group_size):
+    """Cauchy matrix coefficient of data chunk i in parity chunk j."""
+    return gf_inv((group_size + j) ^ i)
+
+def gf_invert_matrix(matrix):
+    """Invert a square matrix over GF(256) with Gauss-Jordan elimination."""
+    n = len(matrix)
+    rows = [list(row) + [int(r == c) for c in range(n)] for r, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = next(r for r in range(col, n) if rows[r][col])
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        scale = gf_inv(rows[col][col])
+        rows[col] = [gf_mul(scale, v) for v in rows[col]]
+        for r in range(n):
+            if r != col and rows[r][col]:
+                factor = rows[r][col]
+                rows[r] = [v ^ gf_mul(factor, p) for v, p in zip(rows[r], rows[col])]
+    return [row[n:] for row in rows]
+
+def scaled(data, constant):
+    """Multiply a chunk by a GF(256) constant, returned as an int for cheap XOR accumulation."""
+    return int.from_bytes(data.translate(gf_mul_table(constant)), "big")
+
+def group_chunk_range(session, group_index):
+    """Sequence numbers of the data chunks in one FEC group (empty past the end of the file)."""
+    group_size = session["fec"][0]
+    first = group_index * group_size
+    return range(first, min(first + group_size, session["total"]))
+
+def group_parity_seqs(session, group_index):
+    """Sequence numbers of the parity chunks held for one FEC group."""
+    parity_count = session["fec"][1]
+    first = group_index * parity_count
+    return [first + j for j in range(parity_count) if first + j in session["parity"]]
+
+def recover_group(session, group_index):
+    """Rebuild the missing chunks of one FEC group if enough parity is held. Returns the count."""
+    group_size, parity_count = session["fec"]
+    chunks = session["chunks"]
+    seqs = group_chunk_range(session, group_index)
+    first, last = seqs.start, seqs.stop
+    missing = [seq for seq in seqs if seq not in chunks]
+    if not missing:
+        return 0
+    parity = [(parity_seq - group_index * parity_count, session["parity"][parity_seq])
+              for parity_seq in group_parity_seqs(session, group_index)][:len(missing)]
+    if len(parity) < len(missing):
+        return 0
+
+    # Syndromes: parity minus the contribution of the chunks we do have
+    length = len(parity[0][1])
+    syndromes = []
+    for j, parity_data in parity:
+        accumulator = int.from_bytes(parity_data, "big")
+        for seq in range(first, last):
+            if seq in chunks:
+                accumulator ^= scaled(chunks[seq].ljust(length, b"\0"), fec_coefficient(j, seq - first, group_size))
+        syndromes.append(accumulator.to_bytes(length, "big"))
+
+    inverse = gf_invert_matrix([[fec_coefficient(j, seq - first, group_size) for seq in missing]
+                                for j, _ in parity])
+    for c, seq in enumerate(missing):
+        accumulator = 0
+        for r, syndrome in enumerate(syndromes):
+            accumulator ^= scaled(syndrome, inverse[c][r])
+        expected = min(session["chunk_size"], session["size"] - seq * session["chunk_size"])
+        chunks[seq] = accumulator.to_bytes(length, "big")[:expected]
+    return len(missing)
+
+def settle_fec_group(session, group_index, sender_ip):
+    """
+    Repair one FEC group as soon as it holds enough parity, and free the group's parity once
+    every data chunk is present, so parity is only kept while it can still be of use.
+    """
+    held = group_parity_seqs(session, group_index)
+    if not held:
+        return
+    recovered = recover_group(session, group_index)
+    if recovered:
+        session["recovered"] = session.get("recovered", 0) + recovered
+        site_counters(sender_ip)["chunks_recovered"] += recovered
+    chunks = session["chunks"]
+    if all(seq in chunks for seq in group_chunk_range(session, group_index)):
+        parity = session["parity"]
+        for parity_seq in held:
+            if isinstance(parity, dict):
+                session["memory"] -= len(parity[parity_seq])
+            del parity[parity_seq]
+
+def add_parity(session, seq, payload, sender_ip):
+    """Keep a parity chunk of a session whose header is known, if its group still needs it."""
+    group_index = seq // session["fec"][1]
+    seqs = group_chunk_range(session, group_index)
+    chunks = session["chunks"]
+    if not seqs or len(payload) > session["chunk_size"] or all(s in chunks for s in seqs):
+        return  # Out of range, malformed, or the group is already complete
+    if isinstance(chunks, PartialFile):
+        if not isinstance(session["parity"], ParityFile):
+            session["parity"] = ParityFile(session["filename"], session["chunk_size"])
+    else:
+        session["memory"] += len(payload)
+    session["parity"][seq] = payload
+    settle_fec_group(session, group_index, sender_ip)
+
+def reply(udp_socket, addr, frame):
+    """Send a control frame back to the sender, if we have a way to reach it."""
+    if udp_socket is None:
+        return
+    try:
+        udp_socket.sendto(frame, addr)
+    except OSError as e:
+        print(f"Error sending reply to {addr[0]}: {e}")
+
+def new_framed_session(total):
+    return {"type": None, "filename": None, "framed": True, "total": total,
+            "size": None, "chunk_size": None, "fec": None, "chunks": {}, "parity": {},
+            "memory": 0, "started": time.monotonic(), "last_active": time.monotonic()}
+
+# Fields of a framed FILENAME header: required ones, then optional ones (which may also be null)
+FRAMED_HEADER_FIELDS = {"id": int, "kind": str, "name": str, "size": int, "chunks": int, "chunk_size": int}
+FRAMED_HEADER_OPTIONAL = {"fec": list, "encoding": str, "original_size": int, "manifest": int}
+FRAMED_KINDS = ("file", "hash_log", "manifest")
+
+def check_framed_header(header):
+    """Raise ValueError unless header is a well-formed framed FILENAME header."""
+    for field, field_type in FRAMED_HEADER_FIELDS.items():
+        if type(header.get(field)) is not field_type:
+            raise ValueError(f"'{field}' is missing or not a {field_type.__name__}")
+    for field, field_type in FRAMED_HEADER_OPTIONAL.items():
+        if header.get(field) is not None and type(header[field]) is not field_type:
+            raise ValueError(f"'{field}' is not a {field_type.__name__}")
+    if header["kind"] not in FRAMED_KINDS:
+        raise ValueError(f"unknown kind '{header['kind']}'")
+    if not 0 <= header["id"] < 2 ** 32:
+        raise ValueError("'id' does not fit a frame")
+    name = header["name"]
+    if not name or os.path.basename(name) != name or name in (".", ".."):
+        raise ValueError(f"'{name}' is not a plain file name")
+    if header["size"] < 0 or header["chunk_size"] <= 0 or header["chunks"] >= 2 ** 32 or \
+            header["chunks"] != (header["size"] + header["chunk_size"] - 1) // header["chunk_size"]:
+        raise ValueError("size, chunk_size and chunks do not agree")
+    fec = header.get("fec")
+    if fec is not None and (len(fec) != 2 or not all(type(n) is int and n > 0 for n in fec)):
+        raise ValueError("'fec' is not a [group size, parity chunks] pair")
+
+def start_framed_session(header, addr, site_name):
+    """Create or complete a framed session from its FILENAME header."""
+    key = (addr[0], header["id"])
+    if key in completed_transfers:
+        # Already received (the retry of a file whose ACK was lost). When the retry comes in a
+        # later batch, that batch's manifest need not wait for it; a header repeated within the
+        # original batch leaves the entry to the file's own check
+        manifest_id = header.get("manifest")
+        if manifest_id is not None and manifest_id != completed_transfers[key]:
+            take_manifest_entry(addr[0], manifest_id, header["name"])
+        return
+    session = sessions.get(key)
+    if session is None:
+        session = new_framed_session(header["chunks"])
+        sessions[key] = session
+    first_header = session["filename"] is None
+    if first_header:
+        print(f"Starting {header['kind']} reception from {site_name}: {header['name']} "
+              f"({header['chunks']} chunks)")
+    chunk_size = header.get("chunk_size")
+    if chunk_size and chunk_size + FRAME_HEADER.size > recv_buffer_size:
+        print(f"Warning: {site_name} uses {chunk_size}-byte chunks but recv_buffer_size is "
+              f"{recv_buffer_size}; datagrams will be truncated")
+    session["type"] = header["kind"]
+    session["filename"] = header["name"]
+    session["size"] = header["size"]
+    session["chunk_size"] = header["chunk_size"]
+    session["fec"] = header.get("fec")
+    session["total"] = header["chunks"]
+    session["encoding"] = header.get("encoding")
+    session["original_size"] = header.get("original_size")
+    session["transfer_id"] = header["id"]
+    session["manifest"] = header.get("manifest")
+
+    if stream_to_disk and session["type"] == "file" and not isinstance(session["chunks"], PartialFile):
+        # Move anything that arrived before the header into the temp file.
+        pending = session["chunks"]
+        session["chunks"] = PartialFile(header["name"], header["chunk_size"], header["chunks"], header["size"])
+        if journal is not None:
+            session["chunks"].unjournaled = []
+        for seq, data in pending.items():
+            if seq < session["total"]:
+                session["chunks"].setdefault(seq, data)
+            session["memory"] -= len(data)
+    if first_header and session["parity"]:
+        # Parity that arrived before the header: keep what the file's groups still need
+        pending, session["parity"] = session["parity"], {}
+        for seq, data in pending.items():
+            session["memory"] -= len(data)
+            if session["fec"]:
+                add_parity(session, seq, data, addr[0])
+    if session.get("journal_key") is None:
+        path = session["chunks"].path if isinstance(session["chunks"], PartialFile) else None
+        journal_start(session, key, site_name, path=path, size=session["size"], chunks=session["total"],
+                      chunk_size=session["chunk_size"], fec=session["fec"], encoding=session["encoding"],
+                      original_size=session["original_size"], manifest=session["manifest"])
+
+def process_frame(frame, addr, site_name, udp_socket):
+    """Handle a framed DATA or END datagram."""
+    frame_type, file_id, seq, total, payload = frame
+    sender_ip = addr[0]
+    key = (sender_ip, file_id)
+
+    if frame_type == FRAME_DATA:
+        if key in completed_transfers:
+            site_counters(sender_ip)["duplicates"] += 1
+            return
+        if seq >= total:
+            return
+        session = sessions.get(key)
+        if session is None:
+            # Header not seen yet (lost or reordered); keep the chunks until it arrives.
+            session = new_framed_session(total)
+            sessions[key] = session
+        session["last_active"] = time.monotonic()
+        chunks = session["chunks"]
+        if seq in chunks:
+            site_counters(sender_ip)["duplicates"] += 1
+        elif isinstance(chunks, dict):
+            if stream_to_disk and session["filename"] is None and len(chunks) >= max_pending_chunks:
+                return  # Still no header; the sender will be NACKed for these later.
+            chunks[seq] = payload
+            session["memory"] += len(payload)
+        else:
+            chunks[seq] = payload
+        if session["fec"] and session["parity"]:
+            settle_fec_group(session, seq // session["fec"][0], sender_ip)
+
+    elif frame_type == FRAME_PARITY:
+        if key in completed_transfers:
+            return
+        session = sessions.get(key)
+        if session is None:
+            session = new_framed_session(total)
+            sessions[key] = session
+        session["last_active"] = time.monotonic()
+        if seq in session["parity"]:
+            return
+        if session["filename"] is None:
+            # Header not seen yet; hold the parity in memory, within the same cap as data chunks
+            if stream_to_disk and len(session["chunks"]) + len(session["parity"]) >= max_pending_chunks:
+                return
+            session["parity"][seq] = payload
+            session["memory"] += len(payload)
+        elif session["fec"]:
+            add_parity(session, seq, payload, sender_ip)
+
+    elif frame_type == FRAME_END:
+        if key in completed_transfers:
+            # Our previous ACK was lost.
+            reply(udp_socket, addr, build_frame(FRAME_ACK, file_id, 0, total))
+            return
+        session = sessions.get(key)
+        if session is None or session["filename"] is None:
+            reply(udp_socket, addr, build_frame(FRAME_RESEND_HEADER, file_id, 0, total))
+            return
+        session["last_active"] = time.monotonic()
+
+        gaps = missing_ranges(session)
+        if gaps:
+            gaps = gaps[:MAX_NACK_RANGES]
+            site_counters(sender_ip)["gaps"] += sum(count for _, count in gaps)
+            payload = b"".join(struct.pack("!II", start, count) for start, count in gaps)
+            reply(udp_socket, addr, build_frame(FRAME_NACK, file_id, len(gaps), total, payload))
+            return
+
+        del sessions[key]
+        if session.get("recovered"):
+            print(f"Recovered {session['recovered']} lost chunk(s) of '{session['filename']}' from parity")
+        if isinstance(session["parity"], ParityFile):
+            session["parity"].discard()
+        session["parity"] = {}
+        complete_session(session, sender_ip)
+        completed_transfers[key] = session.get("manifest")
+        while len(completed_transfers) > COMPLETED_TRANSFER_MEMORY:
+            completed_transfers.popitem(last=False)
+        submit_finalization(session, sender_ip, site_name)
+        reply(udp_socket, addr, build_frame(FRAME_ACK, file_id, 0, total))
+
 # === Packet Processing Function ===
-def process_packet(data, addr):
-    """Process an incoming UDP packet from a sender."""
+def process_packet(data, addr, udp_socket=None):
+    """
+    Process an incoming UDP packet from a sender.
+
+    udp_socket is anything with sendto(data, addr), a socket or an asyncio transport, and is
+    used to send ACK/NACK frames back to framed senders.
+    """
     sender_ip = addr[0]
+    legacy_key = ("legacy", sender_ip, addr[1])
     site_name = SITE_NAMES.get(sender_ip, "Unknown Site")
+    metrics = site_metrics.get(sender_ip) or site_counters(sender_ip)
+    metrics["datagrams"] += 1
+    metrics["bytes"] += len(data)
+
+    frame = parse_frame(data)
+    if frame is not None:
+        process_frame(frame, addr, site_name, udp_socket)
+        return
 
     # Check for control messages (process as bytes to protect binary data):
     if data.startswith(b"FILENAME:"):
@@ -171,121 +1702,413 @@ def process_packet(data, addr):
             print(f"Error decoding FILENAME message from {site_name}")
             return
         filename = message[len("FILENAME:"):]
+        if filename.startswith("{"):
+            # Framed protocol header carrying the transfer metadata: a JSON object. Anything else
+            # is a legacy file name that happens to start with '{'.
+            try:
+                header = json.loads(filename)
+            except json.JSONDecodeError:
+                header = None
+            if isinstance(header, dict):
+                try:
+                    check_framed_header(header)
+                except ValueError as e:
+                    print(f"Dropping malformed framed FILENAME header from {site_name}: {e}")
+                    return
+                start_framed_session(header, addr, site_name)
+                return
         print(f"Starting file reception from {site_name}: {filename}")
-        sessions[sender_ip] = {"type": "file", "filename": filename, "data": bytearray()}
+        data_buffer = PartialFile(filename) if stream_to_disk else bytearray()
+        session = {"type": "file", "filename": filename, "data": data_buffer,
+                   "memory": 0, "started": time.monotonic(), "last_active": time.monotonic()}
+        open_session(legacy_key, session)
+        journal_start(session, legacy_key, site_name)
         return
 
     elif data == b"HASH_LOG_START":
         # Start a new hash log session.
         print(f"Starting hash log reception from {site_name}")
-        sessions[sender_ip] = {"type": "hash_log", "data": bytearray()}
+        session = {"type": "hash_log", "filename": "hash log", "data": bytearray(),
+                   "memory": 0, "started": time.monotonic(), "last_active": time.monotonic()}
+        open_session(legacy_key, session)
+        journal_start(session, legacy_key, site_name)
         return
 
     elif data == b"ALL_FILES_SENT":
         # Log that all files have been sent.
         print(f"Received ALL_FILES_SENT from {site_name}")
+        submit_manifest_check(sender_ip, site_name)
         return
 
     elif data == b"EOF":
         # Finalize the current session for this sender.
-        if sender_ip in sessions:
-            session = sessions[sender_ip]
-            if session["type"] == "file":
-                filename = session["filename"]
-                file_data = session["data"]
-                file_path = os.path.join(received_dir, filename)
-                try:
-                    with open(file_path, 'wb') as f:
-                        f.write(file_data)
-                    print(f"File '{filename}' received successfully from {site_name}")
-
-                    # Copy the file to the appropriate folder based on sender IP.
-                    if sender_ip == fm1_ip:
-                        dest = os.path.join(fm1_dir, filename)
-                    elif sender_ip == fm2_ip:
-                        dest = os.path.join(fm2_dir, filename)
-                    elif sender_ip == fm3_ip:
-                        dest = os.path.join(fm3_dir, filename)
-                    else:
-                        dest = None
-
-                    if dest:
-                        shutil.copy(file_path, dest)
-                    
-                    # Copy .pcap files to NAS if available
-                    if filename.lower().endswith('.pcap') and nas_pcap_dir:
-                        try:
-                            nas_dest = os.path.join(nas_pcap_dir, f"{site_name}_{filename}")
-                            shutil.copy(file_path, nas_dest)
-                            print(f"PCAP file copied to NAS: {nas_dest}")
-                        except Exception as nas_error:
-                            print(f"Warning: Failed to copy PCAP to NAS: {nas_error}")
-                            
-                except Exception as e:
-                    print(f"Error writing file '{filename}' from {site_name}: {e}")
-
-            elif session["type"] == "hash_log":
-                hash_log_data = session["data"]
-                timestamp = time.strftime("%Y%m%d_%H%M%S", time.gmtime())
-                # Create a hash log filename based on the sender's site.
-                if sender_ip == fm1_ip:
-                    hash_log_filename = f"FM1_received_hash_log_{timestamp}.json"
-                elif sender_ip == fm2_ip:
-                    hash_log_filename = f"FM2_received_hash_log_{timestamp}.json"
-                elif sender_ip == fm3_ip:
-                    hash_log_filename = f"FM3_received_hash_log_{timestamp}.json"
-                else:
-                    hash_log_filename = f"{sender_ip}_received_hash_log_{timestamp}.json"
-                hash_log_path = os.path.join(hashlog_dir, hash_log_filename)
-                try:
-                    hash_log_text = hash_log_data.decode('utf-8')
-                    with open(hash_log_path, 'w') as log_file:
-                        log_file.write(hash_log_text)
-                    print(f"Hash log received successfully from {site_name}")
-                    verify_files(received_dir, hash_log_path, corrupted_dir)
-                except Exception as e:
-                    print(f"Error processing hash log from {site_name}: {e}")
-            else:
-                print(f"Unknown session type from {site_name}")
-
-            # Remove the session after finalizing.
-            del sessions[sender_ip]
+        if legacy_key in sessions:
+            session = sessions.pop(legacy_key)
+            complete_session(session, sender_ip)
+            submit_finalization(session, sender_ip, site_name)
         else:
             print(f"Received EOF from {site_name} with no active session.")
         return
 
     else:
         # This is a data chunk; if there's an active session, append the data.
-        if sender_ip in sessions:
-            sessions[sender_ip]["data"].extend(data)
+        if legacy_key in sessions:
+            session = sessions[legacy_key]
+            session["data"].extend(data)
+            session["last_active"] = time.monotonic()
+            if not isinstance(session["data"], PartialFile):
+                session["memory"] += len(data)
         else:
             print(f"Received data from {site_name} with no active session. Ignoring.")
 
+# === Batched Datagram Input ===
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+MSG_WAITFORONE = 0x10000
+MSG_TRUNC = int(getattr(socket, "MSG_TRUNC", 0x20))  # plain int: IntFlag & int goes through enum code
+SOCKADDR_STORAGE_SIZE = 128
+
+try:
+    _recvmmsg = ctypes.CDLL(None, use_errno=True).recvmmsg
+    _recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    _recvmmsg.restype = ctypes.c_int
+except (OSError, AttributeError, TypeError):
+    _recvmmsg = None  # Not Linux/glibc: only the recvfrom() loop is available
+
+def parse_sockaddr(raw):
+    """Decode a raw sockaddr filled in by recvmmsg() into a Python address tuple."""
+    family = struct.unpack_from("=H", raw)[0]
+    port = struct.unpack_from("!H", raw, 2)[0]
+    if family == socket.AF_INET6:
+        flowinfo = struct.unpack_from("!I", raw, 4)[0]
+        scope_id = struct.unpack_from("=I", raw, 24)[0]
+        return socket.inet_ntop(socket.AF_INET6, bytes(raw[8:24])), port, flowinfo, scope_id
+    return socket.inet_ntoa(bytes(raw[4:8])), port
+
+class DatagramReceiver:
+    """
+    Receives up to batch_size datagrams per call.
+
+    Blocks in recvfrom() for the first datagram and drains whatever else is already queued
+    without blocking. With use_mmsg (and recvmmsg() in libc) one recvmmsg() call fills buffers
+    allocated up front instead.
+    """
+
+    def __init__(self, udp_socket, batch_size, buffer_size, use_mmsg=None):
+        self.socket = udp_socket
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.use_mmsg = (use_recvmmsg if use_mmsg is None else use_mmsg) and _recvmmsg is not None
+        self.dontwait = int(getattr(socket, "MSG_DONTWAIT", 0))
+        self.truncated = 0
+        if self.use_mmsg:
+            self.buffer = bytearray(batch_size * buffer_size)
+            self.view = memoryview(self.buffer)
+            self.addresses = {}
+            self.names = ctypes.create_string_buffer(SOCKADDR_STORAGE_SIZE * batch_size)
+            self.iovecs = (_IOVec * batch_size)()
+            self.messages = (_MMsgHdr * batch_size)()
+            base = ctypes.addressof(ctypes.c_char.from_buffer(self.buffer))
+            for i in range(batch_size):
+                self.iovecs[i].iov_base = base + i * buffer_size
+                self.iovecs[i].iov_len = buffer_size
+                header = self.messages[i].msg_hdr
+                header.msg_name = ctypes.addressof(self.names) + i * SOCKADDR_STORAGE_SIZE
+                header.msg_namelen = SOCKADDR_STORAGE_SIZE
+                header.msg_iov = ctypes.pointer(self.iovecs[i])
+                header.msg_iovlen = 1
+            # Snapshot restoring msg_namelen/msg_flags with one memmove before every call
+            self.template = bytes(self.messages)
+            # Reads every (msg_flags, msg_len) pair with a single unpack_from() call
+            flags_offset = _MsgHdr.msg_flags.offset
+            gap = _MMsgHdr.msg_len.offset - flags_offset - ctypes.sizeof(ctypes.c_int)
+            padding = ctypes.sizeof(_MMsgHdr) - _MMsgHdr.msg_len.offset - ctypes.sizeof(ctypes.c_uint)
+            self.results = struct.Struct("@" + f"{flags_offset}xi{gap}xI{padding}x" * batch_size)
+
+    def receive(self):
+        """Block until at least one datagram arrives and return a list of (data, addr)."""
+        if self.use_mmsg:
+            return self._receive_mmsg()
+        return self._receive_loop()
+
+    def _receive_mmsg(self):
+        ctypes.memmove(self.messages, self.template, len(self.template))
+        while True:
+            count = _recvmmsg(self.socket.fileno(), self.messages, self.batch_size, MSG_WAITFORONE, None)
+            if count >= 0:
+                break
+            err = ctypes.get_errno()
+            if err != errno.EINTR:
+                raise OSError(err, os.strerror(err))
+        results = self.results.unpack_from(self.messages)
+        # One copy of the filled-in addresses, sliced per datagram as cache keys
+        names = ctypes.string_at(self.names, count * SOCKADDR_STORAGE_SIZE)
+        addresses = self.addresses
+        view = self.view
+        received = []
+        for i in range(count):
+            name = names[i * SOCKADDR_STORAGE_SIZE:i * SOCKADDR_STORAGE_SIZE + 28]
+            addr = addresses.get(name)
+            if addr is None:
+                if len(addresses) > 4096:
+                    addresses.clear()
+                addr = addresses[name] = parse_sockaddr(name)
+            if results[2 * i] & MSG_TRUNC:
+                self._report_truncation(addr)
+            offset = i * self.buffer_size
+            received.append((view[offset:offset + results[2 * i + 1]].tobytes(), addr))
+        return received
+
+    def _report_truncation(self, addr):
+        self.truncated += 1
+        print(f"Warning: datagram from {addr[0]} truncated to {self.buffer_size} bytes; "
+              f"raise recv_buffer_size ({self.truncated} truncated so far)")
+
+    def _receive_loop(self):
+        recvfrom = self.socket.recvfrom
+        size = self.buffer_size
+        # Block for the first datagram only, then drain what is already queued
+        received = [recvfrom(size)]
+        if self.dontwait:
+            try:
+                for _ in range(self.batch_size - 1):
+                    received.append(recvfrom(size, self.dontwait))
+            except BlockingIOError:
+                pass
+        for data, addr in received:
+            if len(data) == size:
+                self._report_truncation(addr)
+        return received
+
+# === Receive Thread and Statistics ===
+def enlarge_receive_buffer(udp_socket):
+    """Request socket_rcvbuf bytes of kernel receive buffer and report what was granted."""
+    force = getattr(socket, "SO_RCVBUFFORCE", None)
+    try:
+        if force is None:
+            raise PermissionError
+        udp_socket.setsockopt(socket.SOL_SOCKET, force, socket_rcvbuf)
+    except (OSError, PermissionError):
+        try:
+            udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, socket_rcvbuf)
+        except OSError as e:
+            print(f"Warning: Could not set receive buffer: {e}")
+    granted = udp_socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    print(f"Socket receive buffer: {granted // 1024} KB (requested {socket_rcvbuf // 1024} KB)")
+
+def join_multicast_groups(udp_socket):
+    """Join the socket to each group in multicast_groups so group traffic is delivered to it."""
+    for group in multicast_groups:
+        membership = struct.pack("4s4s", socket.inet_aton(group), socket.inet_aton(multicast_interface))
+        try:
+            udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            print(f"Joined multicast group {group} on {multicast_interface}")
+        except OSError as e:
+            print(f"Warning: Could not join multicast group {group}: {e}")
+
+def receive_loop(udp_socket):
+    """Receive thread: move datagrams from the kernel into packet_queue as fast as possible."""
+    receiver = DatagramReceiver(udp_socket, recv_batch_size, recv_buffer_size)
+    while True:
+        try:
+            datagrams = receiver.receive()
+        except OSError as e:
+            if udp_socket.fileno() == -1:
+                return  # Socket closed on shutdown
+            print(f"Socket error: {e}")
+            continue
+        queue_datagrams(datagrams, udp_socket)
+
+def queue_datagrams(datagrams, udp_socket):
+    """Hand a batch to the packet thread, counting it as dropped if the queue is full."""
+    counters["datagrams_received"] += len(datagrams)
+    counters["batches_received"] += 1
+    try:
+        packet_queue.put_nowait((datagrams, udp_socket))
+    except queue.Full:
+        counters["queue_drops"] += len(datagrams)
+
+def kernel_udp_drops():
+    """System-wide UDP receive buffer overflows (RcvbufErrors in /proc/net/snmp), or None."""
+    try:
+        with open("/proc/net/snmp") as snmp:
+            udp_lines = [line.split() for line in snmp if line.startswith("Udp:")]
+        return int(udp_lines[1][udp_lines[0].index("RcvbufErrors")])
+    except (OSError, ValueError, IndexError):
+        return None
+
+def receiver_stats():
+    """Snapshot of the receiver counters plus queue depths."""
+    stats = dict(counters)
+    stats["packet_queue_depth"] = packet_queue.qsize()
+    stats["active_sessions"] = len(sessions)
+    stats["session_memory"] = sum(session["memory"] for session in list(sessions.values()))
+    stats["kernel_rcvbuf_errors"] = kernel_udp_drops()
+    return stats
+
+def print_stats():
+    stats = receiver_stats()
+    print(f"Receiver stats: {stats['datagrams_received']} datagrams, "
+          f"{stats['queue_drops']} dropped (queue full), "
+          f"{stats['kernel_rcvbuf_errors']} kernel buffer overflows (system-wide), "
+          f"queue depth {stats['packet_queue_depth']}, {stats['active_sessions']} active sessions "
+          f"({stats['session_memory'] // 1024} KB in memory), "
+          f"{stats['sessions_evicted_idle']} evicted idle, {stats['sessions_evicted_memory']} evicted "
+          f"over memory budget, {stats['sessions_abandoned']} abandoned, "
+          f"{stats['finalizations_active']} finalizations running")
+    for sender_ip, metrics in list(site_metrics.items()):
+        completed = metrics["sessions_completed"]
+        print(f"  {SITE_NAMES.get(sender_ip, sender_ip)}: {metrics['datagrams_per_sec']:.0f} datagrams/s, "
+              f"{metrics['bytes_per_sec'] / 1e6:.2f} MB/s, {metrics['gaps']} chunks NACKed, "
+              f"{metrics['duplicates']} duplicates, {completed} sessions "
+              f"(avg {metrics['session_seconds'] / max(completed, 1):.1f} s), "
+              f"{metrics['integrity_failures']} integrity failures")
+
 # === Main Receiving Loop ===
+def process_queued_packets(stop=None):
+    """
+    Packet thread: assemble sessions from the batches in packet_queue, then sync the journal,
+    sweep stale sessions, refresh the rates and print statistics. Runs until stop is set.
+    """
+    next_stats = time.monotonic() + stats_interval
+    while stop is None or not stop.is_set():
+        try:
+            datagrams, replies = packet_queue.get(timeout=1)
+        except queue.Empty:
+            datagrams, replies = (), None
+
+        for data, addr in datagrams:
+            try:
+                process_packet(data, addr, replies)
+            except Exception as e:
+                # One bad datagram must not stop the packet thread
+                print(f"Error processing datagram from {addr[0]}: {e!r}")
+        if journal is not None:
+            journal.sync()
+        evict_stale_sessions()
+        update_rates()
+
+        if stats_interval and time.monotonic() >= next_stats:
+            print_stats()
+            next_stats = time.monotonic() + stats_interval
+
 def receive_files_and_hash_logs():
-    """Main loop to receive UDP packets and process them."""
+    """
+    Receive UDP packets and process them.
+
+    A dedicated thread drains the socket into packet_queue; this thread assembles sessions and
+    hands completed ones to the finalization pool, so disk and NAS work never stalls the socket.
+    """
+    global finalize_pool
+    resume_nas_copies()
+    resume_journal()
+    start_metrics_server()
     try:
         udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        enlarge_receive_buffer(udp_socket)
         udp_socket.bind((listen_ip, listen_port))
+        join_multicast_groups(udp_socket)
         print(f"Listening on {listen_ip}:{listen_port}")
     except OSError as e:
         print(f"Error binding to {listen_ip}:{listen_port}: {e}")
         return
 
+    finalize_pool = ThreadPoolExecutor(max_workers=finalize_workers, thread_name_prefix="finalize")
+    threading.Thread(target=receive_loop, args=(udp_socket,), name="udp-receive", daemon=True).start()
     try:
-        while True:
-            try:
-                data, addr = udp_socket.recvfrom(chunk_size)
-            except socket.error as e:
-                print(f"Socket error: {e}")
-                continue
+        process_queued_packets()
+    except KeyboardInterrupt:
+        print("Receiver is shutting down.")
+    finally:
+        udp_socket.close()
+        finalize_pool.shutdown(wait=True)
+        finalize_pool = None
+        if journal is not None:
+            journal.close()
+
+# === asyncio Multi-Port Receiver ===
+def drain_socket(receiver):
+    """Event loop reader: queue what is waiting on one socket (up to a batch) for the packet thread."""
+    try:
+        datagrams = receiver.receive()
+    except BlockingIOError:
+        return  # Nothing left; another reader callback already drained it
+    except OSError as e:
+        print(f"Socket error: {e}")
+        return
+    queue_datagrams(datagrams, receiver.socket)
 
-            process_packet(data, addr)
+def serve_listen_addresses(loop):
+    """Bind a non-blocking socket per listen address, register it with the loop and return them."""
+    sockets = []
+    for ip, port in listen_addresses:
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            enlarge_receive_buffer(udp_socket)
+            udp_socket.bind((ip, port))
+        except OSError as e:
+            print(f"Error binding to {ip}:{port}: {e}")
+            udp_socket.close()
+            continue
+        join_multicast_groups(udp_socket)
+        udp_socket.setblocking(False)
+        loop.add_reader(udp_socket, drain_socket, DatagramReceiver(udp_socket, recv_batch_size, recv_buffer_size))
+        sockets.append(udp_socket)
+        print(f"Listening on {ip}:{port}")
+    return sockets
 
+def receive_files_async():
+    """
+    Receive on every address in listen_addresses from one asyncio event loop.
+
+    Sessions are keyed by sender and transfer id, so a site can run many transfers at once (to
+    one or several ports) without a thread per socket. The loop only drains the sockets, a batch
+    per wakeup; the packet thread assembles sessions and finalization still runs on the pool.
+    """
+    global finalize_pool
+    resume_nas_copies()
+    resume_journal()
+    start_metrics_server()
+    finalize_pool = ThreadPoolExecutor(max_workers=finalize_workers, thread_name_prefix="finalize")
+    stop = threading.Event()
+    packet_thread = threading.Thread(target=process_queued_packets, args=(stop,), name="packet", daemon=True)
+    packet_thread.start()
+    loop = asyncio.SelectorEventLoop()  # add_reader() needs a selector loop, also on Windows
+    sockets = serve_listen_addresses(loop)
+    try:
+        if sockets:
+            loop.run_forever()
     except KeyboardInterrupt:
         print("Receiver is shutting down.")
     finally:
-        udp_socket.close()
+        for udp_socket in sockets:
+            loop.remove_reader(udp_socket)
+            udp_socket.close()
+        loop.close()
+        stop.set()
+        packet_thread.join()
+        finalize_pool.shutdown(wait=True)
+        finalize_pool = None
+        if journal is not None:
+            journal.close()
 
 if __name__ == "__main__":
-    receive_files_and_hash_logs()
+    if receiver_backend == "asyncio":
+        receive_files_async()
+    else:
+        receive_files_and_hash_logs()